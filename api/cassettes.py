@@ -0,0 +1,211 @@
+"""Record the OSF api traffic of each test and replay it without the network.
+
+With API_RECORD_MODE=record, the transport of `osf_api.get_transport` saves every
+request and its response to a cassette per test in API_CASSETTE_DIR, with credentials
+and cookies scrubbed from the headers. Requests made outside of a test, such as the
+lookups at collection time, go to the SESSION_CASSETTE. Under pytest-xdist every
+worker records its own session cassette, so that they don't overwrite each other,
+and the controller merges them into SESSION_CASSETTE when the run is over.
+
+With API_RECORD_MODE=replay, the transport answers every request from the cassettes
+and never opens a connection. Requests are matched on their method, path, query and
+body, in the order they were recorded. A request the current test didn't record is
+answered from any other cassette that did, since session-scoped fixtures only make
+their requests in whichever test happens to run first. Failing that, a request is
+matched without its body, which may contain fake data that differs from run to run.
+"""
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import urllib.parse
+from collections import defaultdict, deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import settings
+
+SESSION_CASSETTE = '_session'
+SCRUBBED_HEADERS = ['authorization', 'cookie', 'set-cookie', 'x-csrftoken']
+
+
+def session_cassette():
+    """Return the cassette of the requests this process makes outside of a test."""
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    return '{}-{}'.format(SESSION_CASSETTE, worker) if worker else SESSION_CASSETTE
+
+
+# The cassette requests are recorded to or replayed from, set by `use`
+current = session_cassette()
+
+# Interactions recorded in this process that haven't been saved yet, by cassette, and
+# the cassettes this process has saved
+_recorded = defaultdict(list)
+_saved = set()
+# Recorded responses by (cassette, request key), by request key across every cassette,
+# and by request key without the body, loaded by the first replayed request
+_index = None
+_lock = threading.Lock()
+
+
+def cassette_name(name):
+    """Return the file name, without extension, of the cassette of test `name`."""
+    return re.sub(r'[^\w.-]+', '_', name)
+
+
+def cassette_path(name):
+    return os.path.join(settings.API_CASSETTE_DIR, cassette_name(name) + '.json')
+
+
+def scrub(headers):
+    return {
+        name: '<scrubbed>' if name.lower() in SCRUBBED_HEADERS else value
+        for name, value in headers.items()
+    }
+
+
+def request_key(method, url, body=None):
+    """Return the normalized form of a request that recorded responses are matched on:
+    its method, path, sorted query and body, with JSON bodies in canonical form.
+    """
+    url = urllib.parse.urlsplit(url)
+    query = sorted(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+    if isinstance(body, bytes):
+        body = body.decode('utf-8', 'replace')
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True)
+    except (TypeError, ValueError):
+        pass
+    return json.dumps([method, url.path, query, body or None])
+
+
+def use(name):
+    """Save the cassette that was in use and record to or replay from `name`, or from
+    the session cassette if it is None.
+    """
+    global current
+    save(current)
+    current = name or session_cassette()
+
+
+def save(name):
+    """Write the interactions recorded for cassette `name` to its file. The cassette
+    recorded by an earlier run is replaced, and ones saved earlier in this run (by the
+    first try of a retried test) are added to.
+    """
+    with _lock:
+        interactions = _recorded.pop(name, [])
+    if not interactions:
+        return
+    path = cassette_path(name)
+    if name in _saved and os.path.exists(path):
+        with open(path) as f:
+            interactions = json.load(f) + interactions
+    _saved.add(name)
+    # Write to a temporary file first, so other processes never read half a file
+    os.makedirs(settings.API_CASSETTE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=settings.API_CASSETTE_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(interactions, f, indent=1)
+    os.replace(temp_path, path)
+
+
+def merge_worker_cassettes():
+    """Add the session cassettes recorded by pytest-xdist workers to SESSION_CASSETTE,
+    after the controller's own, and remove them.
+    """
+    pattern = os.path.join(
+        settings.API_CASSETTE_DIR, cassette_name(SESSION_CASSETTE) + '-*.json'
+    )
+    paths = sorted(glob.glob(pattern))
+    for path in paths:
+        with open(path) as f:
+            interactions = json.load(f)
+        with _lock:
+            _recorded[SESSION_CASSETTE].extend(interactions)
+    save(SESSION_CASSETTE)
+    for path in paths:
+        os.remove(path)
+
+
+def load_index():
+    index = defaultdict(deque)
+    # Only whole cassettes, not the temporary files of one being saved
+    paths = glob.glob(os.path.join(settings.API_CASSETTE_DIR, '*.json'))
+    for path in sorted(paths):
+        with open(path) as f:
+            interactions = json.load(f)
+        cassette = os.path.basename(path)[: -len('.json')]
+        for interaction in interactions:
+            key = interaction['key']
+            request = interaction['request']
+            index[(cassette, key)].append(interaction['response'])
+            index[(None, key)].append(interaction['response'])
+            index[request_key(request['method'], request['url'])].append(
+                interaction['response']
+            )
+    return index
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Send requests to the api and record them to the current cassette."""
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        interaction = {
+            'key': request_key(request.method, request.url, request.body),
+            'request': {
+                'method': request.method,
+                'url': request.url,
+                'headers': scrub(request.headers),
+            },
+            'response': {
+                'status': response.status_code,
+                'reason': response.reason,
+                'headers': scrub(response.headers),
+                'body': response.content.decode('utf-8', 'replace'),
+            },
+        }
+        with _lock:
+            _recorded[current].append(interaction)
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """Answer requests from the recorded cassettes, without the network."""
+
+    def send(self, request, **kwargs):
+        global _index
+        key = request_key(request.method, request.url, request.body)
+        with _lock:
+            if _index is None:
+                _index = load_index()
+            responses = (
+                _index.get((cassette_name(current), key))
+                or _index.get((None, key))
+                or _index.get(request_key(request.method, request.url))
+            )
+            if not responses:
+                raise requests.exceptions.ConnectionError(
+                    'No recorded response for {} {} in {}'.format(
+                        request.method, request.url, cassette_path(current)
+                    ),
+                    request=request,
+                )
+            # Replay the responses in the order they were recorded, and keep repeating
+            # the last one
+            recorded = responses.popleft() if len(responses) > 1 else responses[0]
+
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded['reason']
+        response.headers = CaseInsensitiveDict(recorded['headers'])
+        response._content = recorded['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        return response
@@ -0,0 +1,157 @@
+"""Lease pre-provisioned projects to tests instead of creating one for every test.
+
+With DATA_POOL on, the `data_pool` session fixture provisions DATA_POOL_SIZE projects
+of each kind the project fixtures hand out (private, public, and private with a file)
+concurrently when the session starts. `default_project`, `public_project` and
+`project_with_file` then lease one of them for the length of a test. When a lease ends
+the project is reset by deleting the draft registrations, forks and preprints tests
+create on it. Every pool project has a title of its own, so that tests can pick it out
+of the user's projects by title.
+
+Pool projects are tagged with POOL_TAG, the pytest-xdist worker and their kind, so with
+DATA_POOL_KEEP on they are found again and reused by the next run, and
+`delete_all_user_projects` leaves them alone. Otherwise they are deleted in bulk when
+the session ends.
+"""
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from pythosf import client
+
+import settings
+from api import osf_api
+
+logger = logging.getLogger(__name__)
+
+# The kinds of project in the pool and the arguments they are created with
+KINDS = {
+    'private': {'public': False},
+    'public': {'public': True},
+    'file': {'public': False},
+}
+
+# Projects leased and created, and the seconds spent provisioning, creating single
+# projects and resetting them after a lease
+pool_stats = Counter()
+
+
+def kind_tag(kind):
+    """Return the tag of this process's pool projects of `kind`."""
+    worker = os.environ.get('PYTEST_XDIST_WORKER', 'gw0')
+    return '{}-{}-{}'.format(osf_api.POOL_TAG, worker, kind)
+
+
+class DataPool:
+    def __init__(self, session, size=settings.DATA_POOL_SIZE):
+        self.session = session
+        self.size = size
+        self.free = {kind: [] for kind in KINDS}
+        self.nodes = []
+        self.lock = threading.Lock()
+
+    def create(self, kind):
+        """Create a pool project of `kind` and return it."""
+        start = time.perf_counter()
+        node = osf_api.create_project(
+            self.session,
+            title='OSF Test Project {}'.format(secrets.token_hex(4)),
+            tags=['qatest', kind_tag(kind)],
+            **KINDS[kind]
+        )
+        if kind == 'file':
+            osf_api.upload_fake_file(self.session, node)
+        with self.lock:
+            self.nodes.append(node)
+            pool_stats['created'] += 1
+            pool_stats['create_seconds'] += time.perf_counter() - start
+        return node
+
+    def provision(self):
+        """Reuse the pool projects kept from earlier runs and create the rest
+        concurrently, so that there are `size` free projects of every kind.
+        """
+        start = time.perf_counter()
+        missing = []
+        for kind in KINDS:
+            for node in osf_api.iter_pages(
+                self.session,
+                '/v2/users/me/nodes/',
+                query_parameters={'filter[tags]': kind_tag(kind)},
+            ):
+                # Built from the listed data, so its attributes such as its title
+                # are loaded like those of a created project
+                kept = client.Node(session=self.session, data=node)
+                self.nodes.append(kept)
+                self.free[kind].append(kept)
+            missing += [kind] * max(self.size - len(self.free[kind]), 0)
+
+        with ThreadPoolExecutor(max_workers=settings.API_MAX_CONCURRENCY) as executor:
+            for kind, node in zip(missing, executor.map(self.create, missing)):
+                self.free[kind].append(node)
+        pool_stats['provision_seconds'] += time.perf_counter() - start
+        logger.info(
+            'Data pool provisioned in %.1fs, %s projects kept from earlier runs',
+            time.perf_counter() - start,
+            len(self.nodes) - len(missing),
+        )
+
+    @contextmanager
+    def lease(self, kind):
+        """Lend a free project of `kind` for the enclosed block, creating one if they
+        are all leased, and reset it afterwards.
+        """
+        with self.lock:
+            node = self.free[kind].pop() if self.free[kind] else None
+        if node is None:
+            node = self.create(kind)
+        pool_stats['leases'] += 1
+        try:
+            yield node
+        finally:
+            self.reset(node)
+            with self.lock:
+                self.free[kind].append(node)
+
+    def reset(self, node):
+        """Delete the draft registrations, forks and preprints that tests created on
+        `node`.
+        """
+        start = time.perf_counter()
+        for relationship in ['draft_registrations', 'forks', 'preprints']:
+            url = '/v2/nodes/{}/{}/'.format(node.id, relationship)
+            leftovers = [
+                item['links']['self']
+                for item in osf_api.iter_pages(self.session, url, prefetch=False)
+            ]
+            for leftover_url in leftovers:
+                try:
+                    self.session.delete(url=leftover_url, item_type=None)
+                except Exception as exc:
+                    logger.error('Resetting %s failed: %s', node.id, exc)
+        pool_stats['reset_seconds'] += time.perf_counter() - start
+
+    def teardown(self):
+        """Delete the pool's projects, unless DATA_POOL_KEEP is on."""
+        if not settings.DATA_POOL_KEEP:
+            osf_api.delete_concurrently(
+                self.session,
+                ['/v2/nodes/{}/'.format(node.id) for node in self.nodes],
+            )
+
+
+def seconds_saved(stats):
+    """Return an estimate of the seconds of project setup the pool saved, going by the
+    average time it took to create a pool project, or None if none were created.
+    """
+    if not stats['created']:
+        return None
+    average = stats['create_seconds'] / stats['created']
+    return (
+        stats['leases'] * average - stats['provision_seconds'] - stats['reset_seconds']
+    )
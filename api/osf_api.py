@@ -1,20 +1,322 @@
+import email.utils
+import hashlib
 import json
 import logging
 import os
+import re
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 import requests
 from pythosf import client
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 import settings
+from api import cassettes
+from spans import traced
 
 logger = logging.getLogger(__name__)
 
+# Status codes worth trying a request again for
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+# Items per page when reading a list from the api, the most the OSF api allows
+PAGE_SIZE = 100
+# Tag prefix of the projects api/data_pool.py keeps across runs
+POOL_TAG = 'qatest-pool'
+
+# Query parameters that let the api filter lookups and return only the attributes the
+# helpers read. The helpers still check the attributes, in case a filter is ignored,
+# so the api's default page size is kept for them to look through.
+RECENT_REGISTRATION_QUERY = {
+    'filter[public]': 'true',
+    'filter[revision_state]': 'approved',
+    'filter[withdrawn]': 'false',
+    'fields[registrations]': 'public,revision_state,withdrawn',
+}
+RECENT_PREPRINT_QUERY = {
+    'filter[is_published]': 'true',
+    'fields[preprints]': 'is_published',
+}
+INSTITUTION_NAME_QUERY = {'fields[institutions]': 'name'}
+
+# The connection pool shared by every OSFSession in this process, and the semaphore
+# that bounds how many requests are in flight at once
+_transport = None
+_transport_lock = threading.Lock()
+_in_flight = threading.BoundedSemaphore(settings.API_MAX_CONCURRENCY)
+
+_default_session = None
+
+# The user of each set of credentials, as looked up by current_user_cached
+_current_users = {}
+_current_users_lock = threading.Lock()
+
+# Seconds the responses of slow-changing lookups are cached for, by url path
+CACHE_TTLS = [
+    (re.compile(r'^/v2/_waffle/?$'), 10 * 60),
+    (re.compile(r'^/v2/providers/\w+(/[\w-]+)?/?$'), 60 * 60),
+    (re.compile(r'^/v2/providers/registrations/[\w-]+/schemas/?$'), 24 * 60 * 60),
+    (re.compile(r'^/v2/institutions/?$'), 24 * 60 * 60),
+]
+# Cached responses written before this time are treated as expired, set by the
+# --refresh_api_cache pytest option
+cache_refreshed_at = 0
+cache_stats = Counter()
+
+
+def get_transport():
+    """Return the process-wide requests session, with keep-alive connections pooled per
+    host, and GET/PUT/DELETE requests retried with exponential backoff (honoring
+    Retry-After) when the api answers with one of RETRY_STATUSES. POST and PATCH
+    requests are never retried on a status, since a retry could create a duplicate.
+    Depending on API_RECORD_MODE, requests are recorded to or replayed from cassettes.
+    """
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            retries = Retry(
+                total=settings.API_RETRIES,
+                backoff_factor=settings.API_RETRY_BACKOFF,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=frozenset(['GET', 'PUT', 'DELETE']),
+                raise_on_status=False,
+            )
+            adapter_cls = {
+                'record': cassettes.RecordingAdapter,
+                'replay': cassettes.ReplayAdapter,
+            }.get(settings.API_RECORD_MODE, HTTPAdapter)
+            adapter = adapter_cls(
+                pool_connections=4,
+                pool_maxsize=settings.API_MAX_CONCURRENCY,
+                max_retries=retries,
+            )
+            _transport = requests.Session()
+            _transport.mount('https://', adapter)
+            _transport.mount('http://', adapter)
+        return _transport
 
-def get_default_session():
-    return client.Session(
-        api_base_url=settings.API_DOMAIN,
-        auth=(settings.USER_ONE, settings.USER_ONE_PASSWORD),
+
+def retry_after_seconds(response, attempt):
+    """Return the seconds to wait before retrying a throttled request: those given by
+    the Retry-After header of `response`, in seconds or as an HTTP-date, or else the
+    exponential backoff for the `attempt`th retry.
+    """
+    backoff = settings.API_RETRY_BACKOFF * 2 ** attempt
+    value = response.headers.get('Retry-After')
+    if not value:
+        return backoff
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return backoff
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+
+class OSFSession(client.Session):
+    """A pythosf session that sends its requests through the shared transport and
+    records them as trace events.
+
+    pythosf sends every request on a new connection with `requests.get` and friends, so
+    this reimplements `json_api_request` on top of `get_transport`. Unlike pythosf it
+    raises HTTPErrors with their response attached, and builds the request body with
+    `item_id` rather than the `id` builtin.
+    """
+
+    def json_api_request(
+        self,
+        url,
+        method=None,
+        item_id=None,
+        item_type=None,
+        attributes=None,
+        raw_body=None,
+        query_parameters=None,
+        fields=None,
+        headers=None,
+        retry=True,
+        auth=None,
+    ):
+        url = urllib.parse.urljoin(base=self.api_base_url, url=url)
+        method = method.upper() if method else method
+        if method not in ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']:
+            raise client.exceptions.UnsupportedHTTPMethod(
+                'Only GET/POST/PUT/PATCH/DELETE supported, not {}'.format(method)
+            )
+
+        request_data = {}
+        if raw_body is None:
+            request_body = {}
+            if attributes is not None:
+                request_body['attributes'] = attributes
+            if item_id is not None:
+                request_body['id'] = item_id
+            if item_type is not None:
+                request_body['type'] = item_type
+            request_data['data'] = request_body
+        elif raw_body == '':
+            request_data = None
+            raw_body = None
+
+        query_parameters = dict(query_parameters or {})
+        if not query_parameters.get('version'):
+            query_parameters['version'] = self.default_version
+
+        cached_path = None
+        ttl = cache_ttl(url) if method == 'GET' else None
+        if ttl:
+            cached_path = cache_path(url, query_parameters, auth or self.auth)
+            cached = read_cache(cached_path, ttl)
+            if cached is not None:
+                return cached
+
+        kwargs = {
+            'params': query_parameters,
+            'headers': client.combine_headers(self.base_headers, headers),
+            'auth': auth or self.auth,
+            'timeout': settings.API_TIMEOUT,
+        }
+        if method in ['POST', 'PUT', 'PATCH']:
+            kwargs.update(json=request_data, data=raw_body)
+
+        with traced('{} {}'.format(method, url), 'api'):
+            attempt = 0
+            while True:
+                try:
+                    with _in_flight:
+                        response = get_transport().request(method, url, **kwargs)
+                except requests.exceptions.RequestException as exc:
+                    self.error_count += 1
+                    logger.error('HTTP Request failed: %s', exc)
+                    raise
+                # The transport doesn't retry POST and PATCH requests since they may
+                # have been processed, but a 429 means they weren't
+                if (
+                    response.status_code == 429
+                    and retry
+                    and method in ['POST', 'PATCH']
+                    and attempt < settings.API_RETRIES
+                ):
+                    wait_time = retry_after_seconds(response, attempt)
+                    logger.warning('Throttled: retrying in %.1fs', wait_time)
+                    time.sleep(wait_time)
+                    attempt += 1
+                    continue
+                break
+
+        self.request_count += 1
+        if response.status_code >= 400:
+            self.error_count += 1
+            raise requests.exceptions.HTTPError(
+                'Status code {}. {}'.format(response.status_code, response.content),
+                response=response,
+            )
+        try:
+            data = response.json()
+        except ValueError:
+            return None
+        if cached_path:
+            write_cache(cached_path, data)
+        return data
+
+
+def cache_ttl(url):
+    """Return the seconds the response of a GET of `url` is cached for, or None if it
+    isn't cached.
+    """
+    # Cached lookups would be missing from the cassettes of a recorded run
+    if settings.API_CACHE and settings.API_RECORD_MODE != 'record':
+        path = urllib.parse.urlsplit(url).path
+        for pattern, ttl in CACHE_TTLS:
+            if pattern.match(path):
+                return ttl
+    return None
+
+
+def cache_path(url, query_parameters, auth):
+    """Return the file the response of a GET of `url` by the user in `auth` is cached
+    in.
+    """
+    key = json.dumps(
+        [settings.DOMAIN, url, sorted(query_parameters.items()), auth and auth[0]]
     )
+    return os.path.join(
+        settings.API_CACHE_DIR, hashlib.sha1(key.encode()).hexdigest() + '.json'
+    )
+
+
+def read_cache(path, ttl):
+    """Return the response cached in `path` if it is younger than `ttl` seconds, else
+    None.
+    """
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        cached = None
+    if cached is None or cached['written'] < max(time.time() - ttl, cache_refreshed_at):
+        cache_stats['misses'] += 1
+        return None
+    cache_stats['hits'] += 1
+    return cached['response']
+
+
+def write_cache(path, response):
+    # Write to a temporary file first, so other processes never read half a file
+    os.makedirs(settings.API_CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=settings.API_CACHE_DIR)
+    with os.fdopen(fd, 'w') as f:
+        json.dump({'written': time.time(), 'response': response}, f)
+    os.replace(temp_path, path)
+
+
+def get_default_session():
+    """Return the session for USER_ONE that is shared by every api helper that isn't
+    given a session of its own.
+    """
+    global _default_session
+    if _default_session is None:
+        _default_session = OSFSession(
+            api_base_url=settings.API_DOMAIN,
+            auth=(settings.USER_ONE, settings.USER_ONE_PASSWORD),
+        )
+    return _default_session
+
+
+def iter_pages(
+    session, url, page_size=PAGE_SIZE, query_parameters=None, prefetch=True
+):
+    """Yield every item of the JSON:API list at `url`, reading it one page at a time
+    so that only the current page (and the next one) are held in memory. With
+    `prefetch`, the next page is requested in the background while the current one is
+    being consumed.
+    """
+    query_parameters = dict(query_parameters or {})
+    query_parameters['page[size]'] = page_size
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        page = session.get(url, query_parameters=query_parameters)
+        while True:
+            # The next link keeps the query parameters of the first request
+            next_url = (page.get('links') or {}).get('next')
+            next_page = None
+            if next_url and prefetch:
+                next_page = executor.submit(session.get, next_url)
+            for item in page['data'] or []:
+                yield item
+            if not next_url:
+                return
+            page = next_page.result() if next_page else session.get(next_url)
 
 
 def create_project(session, title='osf selenium test', tags=None, **kwargs):
@@ -38,6 +340,17 @@ def current_user(session=None):
     return user
 
 
+def current_user_cached(session=None):
+    """Return `current_user`, looked up once per api and set of credentials."""
+    if not session:
+        session = get_default_session()
+    key = (session.api_base_url, session.auth)
+    with _current_users_lock:
+        if key not in _current_users:
+            _current_users[key] = current_user(session)
+        return _current_users[key]
+
+
 def get_node(session, node_id=settings.PREFERRED_NODE):
     return client.Node(session=session, id=node_id)
 
@@ -46,11 +359,12 @@ def get_user_institutions(session, user=None):
     if not user:
         user = current_user(session)
     institution_url = user.relationships.institutions['links']['related']['href']
-    data = session.get(institution_url)
-    institutions = []
-    for institution in data['data']:
-        institutions.append(institution['attributes']['name'])
-    return institutions
+    return [
+        institution['attributes']['name']
+        for institution in iter_pages(
+            session, institution_url, query_parameters=INSTITUTION_NAME_QUERY
+        )
+    ]
 
 
 def get_user_addon(session, provider, user=None):
@@ -65,59 +379,76 @@ def get_all_institutions(session=None, data_type='names'):
     if not session:
         session = get_default_session()
     url = '/v2/institutions/'
-    data = session.get(url)
     institutions = []
     if data_type == 'names':
-        for institution in data['data']:
+        for institution in iter_pages(session, url):
             institutions.append(institution['attributes']['name'])
     elif data_type == 'ids':
-        for institution in data['data']:
+        for institution in iter_pages(session, url):
             institutions.append(institution['id'])
     return institutions
 
 
+def delete_concurrently(session, urls, kind='node'):
+    """DELETE every url in `urls` from a pool of API_MAX_CONCURRENCY threads and log
+    the throughput. Each request is retried by the session's transport, and the ones
+    that still fail are reported together once they have all finished. Return the
+    [(url, exception)] of the failures.
+    """
+    start = time.perf_counter()
+    failed = []
+
+    def delete(url):
+        try:
+            # include `item_type=None` b/c pythosf doesn't set a default value for this.
+            session.delete(url=url, item_type=None)
+        except Exception as exc:
+            failed.append((url, exc))
+
+    with ThreadPoolExecutor(max_workers=settings.API_MAX_CONCURRENCY) as executor:
+        list(executor.map(delete, urls))
+
+    elapsed = time.perf_counter() - start
+    deleted = len(urls) - len(failed)
+    if urls:
+        logger.info(
+            'Deleted %s %ss in %.1fs (%.1f %ss/s)',
+            deleted,
+            kind,
+            elapsed,
+            deleted / elapsed,
+            kind,
+        )
+    if failed:
+        logger.error(
+            '\n'.join(
+                "{} '{}' errored with exception: '{}'".format(kind, url, exc)
+                for url, exc in failed
+            )
+        )
+    return failed
+
+
 def delete_all_user_projects(session, user=None):
     """Delete all of your user's projects that they have permission to delete
-    except PREFERRED_NODE (if it's set).
+    except PREFERRED_NODE (if it's set) and the projects of the data pool.
     """
     if not user:
         user = current_user(session)
     nodes_url = user.relationships.nodes['links']['related']['href']
-    for _ in range(3):
-        try:
-            data = session.get(nodes_url)
-        except requests.exceptions.HTTPError as exc:
-            if exc.response.status_code == 502:
-                logger.warning('502 Exception caught. Re-trying test')
-                continue
-            raise exc
-        else:
-            break
-    else:
-        logger.info('Max tries attempted')
-        raise Exception('API not responding. Giving up.')
-
-    nodes_failed = []
-    for node in data['data']:
-        if node['id'] != settings.PREFERRED_NODE:
-            n = client.Node(id=node['id'], session=session)
-            try:
-                n.get()
-                n.delete()
-            except Exception as exc:
-                nodes_failed.append((node['id'], exc))
-                continue
-
-    if nodes_failed:
-        error_message_list = []
-        for error_tuple in nodes_failed:
-            # Position [0] of error_tuple contains node_id
-            # Position [1] of error_tuple contains the exception
-            error_message = "node '{}' errored with exception: '{}'".format(
-                error_tuple[0], error_tuple[1]
-            )
-            error_message_list.append(error_message)
-        logger.error('\n'.join(error_message_list))
+    # Read the whole list before deleting anything, since every deletion moves the
+    # nodes after it up a page. The list already says which nodes can be deleted, so
+    # they are deleted by url without reading each one first.
+    node_urls = [
+        node['links']['self']
+        for node in iter_pages(session, nodes_url)
+        if node['id'] != settings.PREFERRED_NODE
+        and 'admin' in node['attributes'].get('current_user_permissions', ['admin'])
+        and not any(
+            tag.startswith(POOL_TAG) for tag in node['attributes'].get('tags', [])
+        )
+    ]
+    return delete_concurrently(session, node_urls)
 
 
 def delete_project(session, guid, user=None):
@@ -125,8 +456,7 @@ def delete_project(session, guid, user=None):
     if not user:
         user = current_user(session)
     nodes_url = user.relationships.nodes['links']['related']['href']
-    data = session.get(nodes_url)
-    for node in data['data']:
+    for node in iter_pages(session, nodes_url):
         if node['id'] == guid:
             n = client.Node(id=node['id'], session=session)
             n.get()
@@ -147,12 +477,13 @@ def create_custom_collection(session):
 def delete_custom_collections(session):
     """Delete all custom collections for the current user."""
     collections_url = '{}/v2/collections/'.format(session.api_base_url)
-    data = session.get(collections_url)
-
-    for collection in data['data']:
-        if not collection['attributes']['bookmarks']:
-            collection_self_url = collections_url + collection['id']
-            session.delete(url=collection_self_url, item_type=None)
+    # Read the whole list before deleting anything, since deletions shift the pages
+    collection_urls = [
+        collections_url + collection['id']
+        for collection in iter_pages(session, collections_url)
+        if not collection['attributes']['bookmarks']
+    ]
+    return delete_concurrently(session, collection_urls, kind='collection')
 
 
 # TODO rename this to get_node_providers, and create new function that actually IS get_node_addons -
@@ -160,18 +491,13 @@ def delete_custom_collections(session):
 def get_node_addons(session, node_id):
     """Return a list of the names of all the addons connected to the given node."""
     url = '/v2/nodes/{}/files/'.format(node_id)
-    data = session.get(url, query_parameters={'page[size]': 20})
-    providers = []
-    for provider in data['data']:
-        providers.append(provider['attributes']['provider'])
-    return providers
+    return [provider['attributes']['provider'] for provider in iter_pages(session, url)]
 
 
 def waffled_pages(session):
     waffle_list = []
     url = '/v2/_waffle/'
-    data = session.get(url)
-    for page in data['data']:
+    for page in iter_pages(session, url):
         if page['attributes']['active']:
             waffle_list.append(page['attributes']['name'])
     return waffle_list
@@ -221,14 +547,16 @@ def delete_addon_files(session, provider, current_browser, guid):
     """Delete all files for the given addon."""
     files_url = '{}/v2/nodes/{}/files/{}/'.format(session.api_base_url, guid, provider)
 
-    data = session.get(url=files_url, query_parameters={'page[size]': 20})
+    # Read the whole folder before deleting anything, since deletions shift the pages
+    delete_urls = [
+        file['links']['delete']
+        for file in iter_pages(session, files_url)
+        if file['attributes']['kind'] == 'file'
+        and current_browser in file['attributes']['name']
+    ]
 
-    for file in data['data']:
-        if file['attributes']['kind'] == 'file':
-            delete_url = file['links']['delete']
-            file_name = file['attributes']['name']
-            if current_browser in file_name:
-                delete_file(session, delete_url)
+    for delete_url in delete_urls:
+        delete_file(session, delete_url)
 
 
 def delete_file(session, delete_url):
@@ -244,7 +572,7 @@ def get_providers_list(session=None, type='preprints'):
     if not session:
         session = get_default_session()
     url = '/v2/providers/' + type
-    return session.get(url)['data']
+    return list(iter_pages(session, url))
 
 
 def get_provider(session=None, type='registrations', provider_id='osf'):
@@ -340,13 +668,10 @@ def get_registration_schemas_for_provider(session=None, provider_id='osf'):
     if not session:
         session = get_default_session()
     url = 'v2/providers/registrations/{}/schemas/'.format(provider_id)
-    # NOTE: Using '50' as the page size query parameter here. We don't actually have 50
-    # total registration schemas. It's under 30 at this time, but using 50 here gives us
-    # plenty of room to add more schemas without having to update this function.
-    data = session.get(url, query_parameters={'page[size]': 50})['data']
-    if data is None:
-        return None
-    return [[schema['attributes']['name'], schema['id']] for schema in data]
+    return [
+        [schema['attributes']['name'], schema['id']]
+        for schema in iter_pages(session, url)
+    ]
 
 
 def create_draft_registration(session, node_id=None, schema_id=None):
@@ -377,7 +702,7 @@ def get_most_recent_preprint_node_id(session=None):
     if not session:
         session = get_default_session()
     url = '/v2/preprints/'
-    data = session.get(url)['data']
+    data = session.get(url, query_parameters=RECENT_PREPRINT_QUERY)['data']
     if data:
         for preprint in data:
             if preprint['attributes']['is_published']:
@@ -390,12 +715,13 @@ def get_most_recent_registration_node_id(session=None):
     /v2/registrations endpoint currently returns the most recently modified
     registration sorted first. But we still need to check for a public and
     approved registration that has not been withdrawn in order to get a
-    registration that is fully accessible.
+    registration that is fully accessible. The api does that filtering, and only
+    returns the attributes that are checked.
     """
     if not session:
         session = get_default_session()
     url = '/v2/registrations/'
-    data = session.get(url)['data']
+    data = session.get(url, query_parameters=RECENT_REGISTRATION_QUERY)['data']
     if data:
         for registration in data:
             if (
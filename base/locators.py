@@ -8,6 +8,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 
 import settings
 from base import expected_conditions as ec
+from spans import span
 
 
 class WebElementWrapper:
@@ -42,24 +43,26 @@ class WebElementWrapper:
 
         :return: True if element appears. False if timeout.
         """
-        try:
-            self.element
-            return True
-        except ValueError:
-            return False
+        with span('readiness'):
+            try:
+                self.element
+                return True
+            except ValueError:
+                return False
 
     def absent(self):
         """Wait for an element to not be visible on page.
 
         :return: True if element disappears. False if timeout.
         """
-        try:
-            WebDriverWait(self.driver, self.locator.timeout).until(
-                EC.invisibility_of_element_located(self.locator.location)
-            )
-            return True
-        except TimeoutException:
-            return False
+        with span('readiness'):
+            try:
+                WebDriverWait(self.driver, self.locator.timeout).until(
+                    EC.invisibility_of_element_located(self.locator.location)
+                )
+                return True
+            except TimeoutException:
+                return False
 
     def here_then_gone(self):
         """In theory, wait for an element to appear and then disappear.
@@ -69,9 +72,10 @@ class WebElementWrapper:
 
         :return: True if element disappears. False if timeout on waiting for disappearance.
         """
-        self.present()
-        if not self.absent():
-            raise ValueError('Element {} is not absent.'.format(self.name))
+        with span('readiness'):
+            self.present()
+            if not self.absent():
+                raise ValueError('Element {} is not absent.'.format(self.name))
         return True
 
     def click_expecting_popup(self, timeout=settings.TIMEOUT):
@@ -0,0 +1,130 @@
+"""Keep each browser's HTTP cache between test runs.
+
+Every test run used to start with an empty cache and download the ember-osf-web
+bundles again. With BROWSER_CACHE on, each browser and DOMAIN gets a managed cache
+directory under BROWSER_CACHE_DIR. `launch_driver` gives every browser its own copy
+of it so that parallel workers don't contend for the browser's cache locks, and
+`utils.quit_driver` saves the copy back when the run is over.
+
+The cache is thrown away when the fingerprints of the assets deployed to OSF_HOME
+change, since the cached bundles would no longer be used. Workers hold a lock on the
+managed directory while they clear, copy or replace it.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import requests
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_FILE = 'asset-fingerprint'
+# Fingerprinted asset file names, e.g. assets/ember-osf-web-0123456789abcdef.js
+ASSET_PATTERN = re.compile(r'assets/[\w.-]+-[0-9a-f]{16,}\.(?:js|css)')
+
+# The fingerprint of the deployed assets, read once per process by `asset_fingerprint`
+_fingerprint = None
+
+
+def managed_cache_dir(browser):
+    return os.path.join(
+        settings.BROWSER_CACHE_DIR, '{}-{}'.format(browser.lower(), settings.DOMAIN)
+    )
+
+
+@contextmanager
+def locked(managed_dir):
+    """Hold an exclusive lock on `managed_dir` for the enclosed block, so that no other
+    process clears or replaces it while it is read.
+    """
+    os.makedirs(os.path.dirname(managed_dir), exist_ok=True)
+    with open(managed_dir + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def asset_fingerprint():
+    """Return a hash of the fingerprinted asset names on OSF_HOME, or None if the page
+    can't be loaded. OSF_HOME is only read again after a failed attempt, so every
+    browser a test session launches uses the fingerprint of the first.
+    """
+    global _fingerprint
+    if _fingerprint is None:
+        _fingerprint = read_asset_fingerprint()
+    return _fingerprint
+
+
+def read_asset_fingerprint():
+    try:
+        response = requests.get(settings.OSF_HOME, timeout=settings.TIMEOUT)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        logger.warning('Could not read the deployed asset fingerprint')
+        return None
+    assets = sorted(set(ASSET_PATTERN.findall(response.text)))
+    return hashlib.sha1('\n'.join(assets).encode()).hexdigest()
+
+
+def prepare_cache_dir(browser):
+    """Return a private copy of the browser's managed cache directory, after
+    invalidating the managed directory if the deployed assets have changed. Only the
+    copy of pytest-xdist worker gw0 is saved back by `save_cache_dir`.
+    """
+    managed_dir = managed_cache_dir(browser)
+    fingerprint_file = os.path.join(managed_dir, FINGERPRINT_FILE)
+    fingerprint = asset_fingerprint()
+    worker_dir = os.path.join(tempfile.mkdtemp(prefix='selenium-a11y-cache-'), 'cache')
+
+    with locked(managed_dir):
+        if os.path.isdir(managed_dir) and fingerprint:
+            cached = None
+            if os.path.exists(fingerprint_file):
+                with open(fingerprint_file) as f:
+                    cached = f.read()
+            if cached != fingerprint:
+                logger.info('Deployed assets changed, clearing %s', managed_dir)
+                shutil.rmtree(managed_dir)
+
+        os.makedirs(managed_dir, exist_ok=True)
+        if fingerprint:
+            with open(fingerprint_file, 'w') as f:
+                f.write(fingerprint)
+
+        shutil.copytree(managed_dir, worker_dir)
+    return worker_dir
+
+
+def save_cache_dir(browser, worker_dir):
+    """Replace the managed cache directory with a browser's copy once the browser has
+    quit, and remove the copy. Under pytest-xdist only the first worker, gw0, saves
+    its copy, and the other workers' copies are thrown away.
+    """
+    if os.environ.get('PYTEST_XDIST_WORKER', 'gw0') == 'gw0':
+        managed_dir = managed_cache_dir(browser)
+        staging_dir = managed_dir + '.saving'
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        shutil.copytree(worker_dir, staging_dir)
+        with locked(managed_dir):
+            shutil.rmtree(managed_dir, ignore_errors=True)
+            os.rename(staging_dir, managed_dir)
+    shutil.rmtree(os.path.dirname(worker_dir), ignore_errors=True)
+
+
+def first_page_load_seconds(driver, url=settings.OSF_HOME):
+    """Load `url` and return the time until its load event from the navigation timing."""
+    driver.get(url)
+    milliseconds = driver.execute_script(
+        'var timing = window.performance.timing;'
+        'return timing.loadEventEnd - timing.navigationStart;'
+    )
+    return milliseconds / 1000
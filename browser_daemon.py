@@ -0,0 +1,277 @@
+"""A local daemon that keeps warmed up browsers running between test runs.
+
+Start it with `invoke browser_daemon` and set BROWSER_DAEMON to its address. From then
+on `utils.launch_driver` attaches to one of the daemon's browsers instead of starting a
+new one, and quitting that driver hands the browser back when the run is over.
+
+A browser is leased for as long as the client's connection stays open, so a test run
+that dies without releasing its browser still gives it back. Browsers are health
+checked before they are handed out and replaced after BROWSER_DAEMON_MAX_USES leases
+to keep their memory use bounded, and their cookies and storage are cleared so that
+one run's logged in state doesn't leak into the next.
+
+Clients authenticate with BROWSER_DAEMON_KEY. Unless it is set, the daemon generates a
+random key when it starts and writes it to BROWSER_DAEMON_KEY_FILE, which only the
+current user can read, and test runs read it from there.
+"""
+import logging
+import os
+import secrets
+import threading
+from multiprocessing.connection import Client, Listener
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+
+# Clears the storage of the current page's origin
+CLEAR_STORAGE_SCRIPT = 'window.localStorage.clear(); window.sessionStorage.clear();'
+
+
+def parse_address(address):
+    """Turn a 'host:port' string into a (host, port) tuple."""
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+
+def generate_authkey(path=settings.BROWSER_DAEMON_KEY_FILE):
+    """Write a random key to `path` that only the current user can read, and return
+    it.
+    """
+    key = secrets.token_hex(32)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    # The file may already exist with a looser mode
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(key)
+    return key.encode()
+
+
+def authkey(path=settings.BROWSER_DAEMON_KEY_FILE):
+    """Return the key to authenticate to the daemon with: BROWSER_DAEMON_KEY if it is
+    set, or else the one the daemon wrote to `path`.
+    """
+    if settings.BROWSER_DAEMON_KEY:
+        return settings.BROWSER_DAEMON_KEY.encode()
+    with open(path) as f:
+        return f.read().strip().encode()
+
+
+class WarmBrowser:
+    """A browser owned by the daemon and the number of times it has been leased."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+
+    def session_info(self):
+        return {
+            'executor_url': self.driver.command_executor._url,
+            'session_id': self.driver.session_id,
+            'capabilities': self.driver.capabilities,
+            'w3c': self.driver.w3c,
+        }
+
+    def healthy(self):
+        try:
+            self.driver.window_handles
+        except WebDriverException:
+            return False
+        return True
+
+    def reset(self):
+        """Close all but the first window and leave it on a blank page."""
+        handles = self.driver.window_handles
+        for handle in handles[1:]:
+            self.driver.switch_to.window(handle)
+            self.driver.close()
+        self.driver.switch_to.window(handles[0])
+        self.driver.get('about:blank')
+
+    def clear_state(self):
+        """Delete the cookies and local and session storage of OSF and CAS, except for
+        the cookie that dismisses the cookie banner.
+        """
+        for domain in [settings.OSF_HOME, settings.CAS_DOMAIN]:
+            # Cookies and storage can only be reached from a page on their own domain
+            self.driver.get(domain + '/favicon.ico')
+            self.driver.delete_all_cookies()
+            self.driver.execute_script(CLEAR_STORAGE_SCRIPT)
+        self.driver.get(settings.OSF_HOME + '/favicon.ico')
+        self.driver.add_cookie(
+            {'name': 'osf_cookieconsent', 'value': '1', 'domain': '.osf.io'}
+        )
+        self.driver.get('about:blank')
+
+
+class BrowserDaemon:
+    """Hand out up to `size` warm browsers, replacing each after `max_uses` leases."""
+
+    def __init__(self, size=1, max_uses=settings.BROWSER_DAEMON_MAX_USES):
+        self.size = size
+        self.max_uses = max_uses
+        self.idle = []
+        self.leased = 0
+        self.condition = threading.Condition()
+
+    def launch(self):
+        # utils imports this module to attach to the daemon
+        from utils import launch_driver
+
+        driver = launch_driver(use_daemon=False)
+        # Warm up the browser: load the app and dismiss the cookie banner
+        driver.get(settings.OSF_HOME)
+        driver.add_cookie(
+            {'name': 'osf_cookieconsent', 'value': '1', 'domain': '.osf.io'}
+        )
+        driver.get('about:blank')
+        logger.info('Launched browser session %s', driver.session_id)
+        return WarmBrowser(driver)
+
+    def retire(self, browser):
+        from utils import quit_driver
+
+        logger.info(
+            'Retiring browser session %s after %s uses',
+            browser.driver.session_id,
+            browser.uses,
+        )
+        try:
+            # Saves the browser's HTTP cache and removes its temporary profile
+            quit_driver(browser.driver)
+        except WebDriverException:
+            pass
+
+    def lease(self):
+        """Return a healthy idle browser, launching one if the pool isn't full yet and
+        waiting for one to be released otherwise.
+        """
+        with self.condition:
+            while not self.idle and self.leased >= self.size:
+                self.condition.wait()
+            self.leased += 1
+            browser = self.idle.pop() if self.idle else None
+
+        try:
+            while browser is not None:
+                try:
+                    if browser.healthy():
+                        browser.clear_state()
+                        break
+                except WebDriverException:
+                    pass
+                self.retire(browser)
+                with self.condition:
+                    browser = self.idle.pop() if self.idle else None
+            if browser is None:
+                browser = self.launch()
+        except Exception:
+            with self.condition:
+                self.leased -= 1
+                self.condition.notify()
+            raise
+        browser.uses += 1
+        return browser
+
+    def release(self, browser):
+        """Take a browser back, retiring it if it is worn out or broken."""
+        try:
+            if browser.uses >= self.max_uses or not browser.healthy():
+                self.retire(browser)
+                browser = None
+            else:
+                browser.reset()
+        except WebDriverException:
+            self.retire(browser)
+            browser = None
+
+        with self.condition:
+            self.leased -= 1
+            if browser is not None:
+                self.idle.append(browser)
+            self.condition.notify()
+
+    def serve_client(self, connection):
+        """Lease a browser to one client until it releases it or disconnects."""
+        browser = None
+        try:
+            while True:
+                request = connection.recv()
+                if request == 'lease' and browser is None:
+                    browser = self.lease()
+                    connection.send(browser.session_info())
+                elif request == 'release':
+                    break
+                elif request == 'status':
+                    connection.send(self.status())
+        except EOFError:
+            if browser is not None:
+                logger.warning('Client disconnected without releasing its browser')
+        finally:
+            if browser is not None:
+                self.release(browser)
+            connection.close()
+
+    def status(self):
+        with self.condition:
+            return {
+                'size': self.size,
+                'leased': self.leased,
+                'idle': len(self.idle),
+                'uses': [browser.uses for browser in self.idle],
+            }
+
+    def serve_forever(self, address=settings.BROWSER_DAEMON):
+        key = authkey() if settings.BROWSER_DAEMON_KEY else generate_authkey()
+        with Listener(parse_address(address), authkey=key) as listener:
+            logger.info('Browser daemon listening on %s', address)
+            # Start with a full pool so the first test runs get warm browsers too
+            for _ in range(self.size):
+                self.idle.append(self.launch())
+            try:
+                while True:
+                    connection = listener.accept()
+                    threading.Thread(
+                        target=self.serve_client, args=(connection,), daemon=True
+                    ).start()
+            finally:
+                for browser in self.idle:
+                    self.retire(browser)
+
+
+def status(address=settings.BROWSER_DAEMON):
+    """Return the pool status reported by the daemon at `address`."""
+    with Client(parse_address(address), authkey=authkey()) as connection:
+        connection.send('status')
+        return connection.recv()
+
+
+class DaemonDriver(webdriver.Remote):
+    """A WebDriver attached to a browser session leased from the browser daemon."""
+
+    def __init__(self, address=settings.BROWSER_DAEMON):
+        self.daemon_connection = Client(parse_address(address), authkey=authkey())
+        self.daemon_connection.send('lease')
+        self.session_info = self.daemon_connection.recv()
+        super().__init__(
+            command_executor=self.session_info['executor_url'],
+            desired_capabilities={},
+        )
+
+    def start_session(self, capabilities, browser_profile=None):
+        """Attach to the leased session instead of creating a new one."""
+        self.session_id = self.session_info['session_id']
+        self.capabilities = self.session_info['capabilities']
+        self.w3c = self.session_info['w3c']
+
+    def quit(self):
+        """Hand the browser back to the daemon instead of closing it."""
+        try:
+            self.daemon_connection.send('release')
+        finally:
+            self.daemon_connection.close()
@@ -1,9 +1,40 @@
+import logging
 import os
+import time
+from collections import Counter
 
 import pandas as pd
 from axe_selenium_python import Axe
+from selenium.common.exceptions import (
+    StaleElementReferenceException,
+    WebDriverException,
+)
 
+import prefetcher
+import request_blocker
 import settings
+from spans import span
+
+logger = logging.getLogger(__name__)
+
+# Pages scanned by `scan_in_tabs`, the wall-clock time it took, and the time the same
+# pages spent loading and being scanned in their tabs
+tab_scan_stats = Counter()
+
+# Run axe on the current page with the options in arguments[0] and keep the results
+# in the page until AXE_RESULTS_SCRIPT fetches them
+AXE_RUN_SCRIPT = """
+var callback = arguments[arguments.length - 1];
+axe.run(arguments[0] || {}).then(function (results) {
+    window.a11yResults = results;
+    callback();
+});
+"""
+AXE_RESULTS_SCRIPT = """
+var results = window.a11yResults;
+delete window.a11yResults;
+return results;
+"""
 
 
 class ApplyA11yRules:
@@ -27,36 +58,62 @@ class ApplyA11yRules:
             exclude the Best Practice rule set when performing accessibility check.
             - default = False
         """
+        axe, results = ApplyA11yRules.scan_page(driver, exclude_best_practice)
+        ApplyA11yRules.check_results(
+            axe,
+            results,
+            page_name,
+            write_files=write_files,
+            terminal_errors=terminal_errors,
+        )
+
+    def scan_page(driver, exclude_best_practice=False):
+        """Run the axe testing engine on the page in the driver's current window and
+        return the axe instance along with its results.
+        """
+        # Let the next test's page download while axe runs
+        prefetch = prefetcher.prefetch(driver)
         axe = Axe(driver)
         # Inject axe-core javascript into page.
-        axe.inject()
-        # Run axe accessibility checks.
+        with span('axe inject'):
+            axe.inject()
+        # This runs axe with all available rule sets which includes WCAG and Best
+        # Practoce rules.
+        options = None
         if exclude_best_practice:
             # When exclude_best_practice parameter is set to True, then we want to run
             # axe with only the WCAG rule sets.
-            results = axe.run(
-                # context={
-                #     'exclude': [
-                #         ['#search'],
-                #         ['.text-center'],
-                #         ['._StateText_1iudhh'],
-                #         ['._UpdateText_1u9k9o'],
-                #         ['#oneTimePassword'],
-                #     ]
-                # },
-                options={
-                    'runOnly': {
-                        'type': 'tag',
-                        'values': ['wcag2a', 'wcag2aa', 'wcag21aa'],
-                    }
-                },
-            )
-        else:
-            # This runs axe with all available rule sets which includes WCAG and Best
-            # Practoce rules.
-            results = axe.run()
+            # context={
+            #     'exclude': [
+            #         ['#search'],
+            #         ['.text-center'],
+            #         ['._StateText_1iudhh'],
+            #         ['._UpdateText_1u9k9o'],
+            #         ['#oneTimePassword'],
+            #     ]
+            # },
+            options = {
+                'runOnly': {
+                    'type': 'tag',
+                    'values': ['wcag2a', 'wcag2aa', 'wcag21aa'],
+                }
+            }
+        # Run axe accessibility checks. The results are fetched separately so that
+        # the time it takes to transfer them is measured on its own.
+        with span('axe run'):
+            driver.execute_async_script(AXE_RUN_SCRIPT, options)
+        with span('result transfer'):
+            results = driver.execute_script(AXE_RESULTS_SCRIPT)
+        prefetcher.collect(driver, prefetch)
+        return axe, results
+
+    def check_results(axe, results, page_name, write_files=True, terminal_errors=True):
+        """Write the results files for a scan by `scan_page` and assert that it found
+        no violations. The parameters are the same as those of `run_axe`.
+        """
         if write_files:
-            write_results_files(axe, results, page_name)
+            with span('file write'):
+                write_results_files(axe, results, page_name)
         if terminal_errors:
             # Assert no violations are found
             assert len(results['violations']) == 0, axe.report(results['violations'])
@@ -82,12 +139,11 @@ def write_results_files(axe, results, page_name):
     - page_name - string - unique identifier for the web page being tested - used as
         part of file name when writing results files
     """
-    # Writing all files to a local folder 'a11y_results' to keep them a little more
-    # organized
-    work_dir = 'a11y_results'
-    # Have to first check if the folder exists - if not then create it
-    if not os.path.isdir(work_dir):
-        os.mkdir(work_dir)
+    # Writing all files to a local folder (A11Y_RESULTS_DIR, 'a11y_results' by default)
+    # to keep them a little more organized
+    work_dir = settings.A11Y_RESULTS_DIR
+    # Create the folder if it doesn't exist yet - parallel workers may race to do this
+    os.makedirs(work_dir, exist_ok=True)
     # Files for Passed Rules
     file_name_passes = os.path.join(
         work_dir, 'a11y_' + page_name + '_passes_' + settings.DOMAIN + '.json'
@@ -118,3 +174,155 @@ def write_results_files(axe, results, page_name):
         work_dir, 'a11y_' + page_name + '_incomplete_' + settings.DOMAIN + '.csv'
     )
     pandaObject.to_csv(file_name_incomplete_csv)
+
+
+def showing(page, locator_name):
+    """Return True if the element of `page`'s locator is displayed right now, without
+    waiting for it like the locator itself would.
+    """
+    locator = getattr(type(page), locator_name)
+    try:
+        return any(
+            element.is_displayed()
+            for element in page.driver.find_elements(locator.selector, locator.path)
+        )
+    except StaleElementReferenceException:
+        return False
+
+
+def tab_settled(page, ready=None):
+    """Return True if the page in the current window has finished loading, shows its
+    identity element, and passes the optional `ready` check.
+    """
+    if page.driver.execute_script('return document.readyState') != 'complete':
+        return False
+    return showing(page, 'identity') and (ready is None or ready(page))
+
+
+def here_then_gone(locator_name):
+    """Return a `ready` check for `scan_in_tabs` that, like `Locator.here_then_gone`,
+    passes once the element of the page's locator has been displayed and is gone again,
+    or once it hasn't been displayed within the locator's timeout. Make one per page.
+    """
+    state = {'seen': False, 'since': None}
+
+    def ready(page):
+        if showing(page, locator_name):
+            state['seen'] = True
+            return False
+        if state['since'] is None:
+            state['since'] = time.monotonic()
+        timeout = getattr(type(page), locator_name).timeout
+        return state['seen'] or time.monotonic() - state['since'] >= timeout
+
+    return ready
+
+
+def check_tab_scan(tab_scans, page_name, write_files=True):
+    """Check the results of `page_name` from `scan_in_tabs` like `run_axe` would, and
+    return True, or return False if the page wasn't scanned in a tab. The results are
+    only used once, so a re-run of a test that failed the check scans the page again
+    the usual way.
+    """
+    scan = tab_scans.pop(page_name, None)
+    if scan is None:
+        return False
+    ApplyA11yRules.check_results(*scan, page_name, write_files=write_files)
+    return True
+
+
+def js_heap_mb(driver):
+    """Return the JavaScript heap size of the current window in MB. Only Chromium
+    based browsers report it, so this is 0 for the others.
+    """
+    heap = driver.execute_script(
+        'return window.performance.memory ? performance.memory.usedJSHeapSize : 0;'
+    )
+    return heap / 1e6
+
+
+def open_tab(driver, url):
+    """Open `url` in a new tab and return the tab's window handle."""
+    handles = set(driver.window_handles)
+    driver.execute_script('window.open(arguments[0], "_blank");', url)
+    return next(
+        handle for handle in driver.window_handles if handle not in handles
+    )
+
+
+def scan_in_tabs(driver, pages, exclude_best_practice=False):
+    """Scan anonymous public pages several at a time, each in its own tab, so that
+    their page loads overlap instead of adding up. Does nothing unless TAB_SCANNING is
+    on and there are at least two pages.
+
+    `pages` is a list of (page name, page object, ready) tuples, where `ready` is None
+    or a function that takes the page and returns True once it can be scanned. Up to
+    MAX_SCAN_TABS tabs are open at once, and no more are opened while the open tabs
+    use more than TAB_SCANNING_MEMORY_MB of JavaScript heap. Each tab is scanned as soon
+    as it settles and then closed.
+
+    Returns {page name: (axe, results)} for the pages that were scanned. Pages that
+    didn't settle within LONG_TIMEOUT or failed to scan are left out, so that their
+    tests can load and scan them the usual way.
+    """
+    if not settings.TAB_SCANNING or len(pages) < 2:
+        return {}
+
+    start = time.monotonic()
+    original = driver.current_window_handle
+    pending = list(pages)
+    # Window handle: (page name, page, ready, time the tab was opened)
+    tabs = {}
+    heap = {}
+    scans = {}
+    # Traffic from several tabs can't be told apart, so attribute it to all of them
+    request_blocker.set_page('tab scans')
+    try:
+        while pending or tabs:
+            driver.switch_to.window(original)
+            while (
+                pending
+                and len(tabs) < settings.MAX_SCAN_TABS
+                and (not tabs or sum(heap.values()) < settings.TAB_SCANNING_MEMORY_MB)
+            ):
+                page_name, page, ready = pending.pop(0)
+                tabs[open_tab(driver, page.url)] = (
+                    page_name,
+                    page,
+                    ready,
+                    time.monotonic(),
+                )
+
+            settled = []
+            for handle, (page_name, page, ready, opened) in tabs.items():
+                driver.switch_to.window(handle)
+                try:
+                    heap[handle] = js_heap_mb(driver)
+                    if tab_settled(page, ready):
+                        scans[page_name] = ApplyA11yRules.scan_page(
+                            driver, exclude_best_practice
+                        )
+                    elif time.monotonic() - opened < settings.LONG_TIMEOUT:
+                        continue
+                    else:
+                        logger.warning('%s did not settle in its tab', page_name)
+                except WebDriverException:
+                    logger.warning('Could not scan %s in its tab', page_name)
+                tab_scan_stats['page_seconds'] += time.monotonic() - opened
+                settled.append(handle)
+                driver.close()
+
+            for handle in settled:
+                del tabs[handle]
+                heap.pop(handle, None)
+            if not settled:
+                time.sleep(0.25)
+    finally:
+        for handle in tabs:
+            driver.switch_to.window(handle)
+            driver.close()
+        driver.switch_to.window(original)
+
+    tab_scan_stats['pages'] += len(scans)
+    tab_scan_stats['seconds'] += time.monotonic() - start
+    return scans
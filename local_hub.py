@@ -0,0 +1,275 @@
+"""A WebDriver hub that fronts a few local headless browsers.
+
+Start it with `invoke local_hub` and run the tests with DRIVER=Remote and
+REMOTE_HUB_URL pointing at it. The hub speaks just enough of the WebDriver protocol
+for `launch_driver`'s Remote path: new session requests wait in a queue until one of
+its nodes is free, and every other command is forwarded to the node that owns the
+session. That makes it possible to load test the remote and parallel code paths on
+one machine without BrowserStack.
+
+Each node is a local driver service (chromedriver, geckodriver or msedgedriver) that
+runs one headless browser session at a time. The hub keeps track of how long new
+sessions waited for a node and how many sessions and commands it served, and reports
+them from its /status endpoint.
+"""
+import json
+import logging
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from selenium.webdriver.chrome.service import Service as ChromiumService
+from selenium.webdriver.firefox.service import Service as FirefoxService
+
+import settings
+from utils import HEADLESS_CHROMIUM_ARGS
+
+logger = logging.getLogger(__name__)
+
+# How each browser is started and made headless: (driver service class, driver
+# executable, W3C browserName, vendor options capability, headless arguments)
+BROWSERS = {
+    'Chrome': (
+        ChromiumService,
+        'chromedriver',
+        'chrome',
+        'goog:chromeOptions',
+        HEADLESS_CHROMIUM_ARGS,
+    ),
+    'Edge': (
+        ChromiumService,
+        'msedgedriver',
+        'MicrosoftEdge',
+        'ms:edgeOptions',
+        HEADLESS_CHROMIUM_ARGS,
+    ),
+    'Firefox': (
+        FirefoxService,
+        'geckodriver',
+        'firefox',
+        'moz:firefoxOptions',
+        [
+            '-headless',
+            '--width={}'.format(settings.WINDOW_SIZE[0]),
+            '--height={}'.format(settings.WINDOW_SIZE[1]),
+        ],
+    ),
+}
+VENDOR_OPTIONS = [browser[3] for browser in BROWSERS.values()]
+
+
+class HubNode:
+    """A local driver service that runs one browser session at a time."""
+
+    def __init__(self, browser):
+        service_cls, executable = BROWSERS[browser][:2]
+        self.service = service_cls(executable)
+        self.service.start()
+        self.url = self.service.service_url
+        self.session_id = None
+        self.last_used = None
+
+    def stop(self):
+        if self.session_id:
+            self.delete_session()
+        self.service.stop()
+
+    def delete_session(self):
+        try:
+            requests.delete(
+                '{}/session/{}'.format(self.url, self.session_id),
+                timeout=settings.TIMEOUT,
+            )
+        except requests.exceptions.RequestException:
+            pass
+        self.session_id = None
+
+
+class LocalHub(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, browser='Chrome', size=2, session_timeout=300):
+        super().__init__(address, LocalHubHandler)
+        self.browser = browser
+        self.session_timeout = session_timeout
+        self.nodes = [HubNode(browser) for _ in range(size)]
+        self.sessions = {}
+        self.condition = threading.Condition()
+        self.started = time.monotonic()
+        self.queue_waits = []
+        self.commands = 0
+
+    def new_session_capabilities(self, requested):
+        """Turn the W3C capabilities of a new session request into ones for the hub's
+        headless browser.
+        """
+        always_match = dict(requested.get('alwaysMatch', {}))
+        _, _, browser_name, options_key, headless_args = BROWSERS[self.browser]
+        # Options meant for another browser would be rejected by the driver
+        for key in VENDOR_OPTIONS:
+            if key != options_key:
+                always_match.pop(key, None)
+        options = dict(always_match.get(options_key, {}))
+        options['args'] = options.get('args', []) + headless_args
+        always_match[options_key] = options
+        always_match['browserName'] = browser_name
+        if self.browser == 'Edge':
+            always_match['ms:edgeChromium'] = True
+        return {'alwaysMatch': always_match, 'firstMatch': [{}]}
+
+    def acquire_node(self):
+        """Wait for a free node and return it. Sessions that haven't sent a command in
+        `session_timeout` seconds are assumed to be abandoned and are ended.
+        """
+        queued = time.monotonic()
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                for node in self.nodes:
+                    if node.session_id and now - node.last_used > self.session_timeout:
+                        logger.warning('Ending abandoned session %s', node.session_id)
+                        self.sessions.pop(node.session_id, None)
+                        node.delete_session()
+                free = [node for node in self.nodes if not node.session_id]
+                if free:
+                    node = free[0]
+                    # Hold the node while its session is being created
+                    node.session_id = 'pending'
+                    node.last_used = now
+                    self.queue_waits.append(now - queued)
+                    return node
+                self.condition.wait(timeout=self.session_timeout)
+
+    def release_node(self, node):
+        with self.condition:
+            self.sessions.pop(node.session_id, None)
+            node.session_id = None
+            self.condition.notify()
+
+    def status(self):
+        with self.condition:
+            elapsed = time.monotonic() - self.started
+            waits = sorted(self.queue_waits)
+            return {
+                'browser': self.browser,
+                'nodes': len(self.nodes),
+                'busy': len([node for node in self.nodes if node.session_id]),
+                'sessions': len(waits),
+                'commands': self.commands,
+                'sessions_per_minute': len(waits) / elapsed * 60,
+                'commands_per_second': self.commands / elapsed,
+                'median_queue_wait': statistics.median(waits) if waits else 0,
+                'max_queue_wait': waits[-1] if waits else 0,
+            }
+
+    def serve_forever(self):
+        logger.info(
+            'Local hub with %s %s nodes listening on http://%s:%s/wd/hub',
+            len(self.nodes),
+            self.browser,
+            *self.server_address,
+        )
+        try:
+            super().serve_forever()
+        finally:
+            for node in self.nodes:
+                node.stop()
+
+
+class LocalHubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+    def route(self, method):
+        path = self.path
+        if path.startswith('/wd/hub'):
+            path = path[len('/wd/hub') :]
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+        parts = path.strip('/').split('/')
+
+        if method == 'GET' and parts == ['status']:
+            self.respond(200, {'value': dict(ready=True, **self.server.status())})
+        elif method == 'POST' and parts == ['session']:
+            self.new_session(body)
+        elif parts[0] == 'session' and len(parts) > 1:
+            self.forward(method, path, body, parts[1])
+        else:
+            self.respond(404, {'value': {'error': 'unknown command', 'message': path}})
+
+    def new_session(self, body):
+        hub = self.server
+        node = hub.acquire_node()
+        capabilities = hub.new_session_capabilities(body.get('capabilities', {}))
+        try:
+            response = requests.post(
+                node.url + '/session',
+                json={'capabilities': capabilities},
+                timeout=settings.VERY_LONG_TIMEOUT,
+            )
+            session_id = response.json()['value'].get('sessionId')
+        except (requests.exceptions.RequestException, ValueError, KeyError):
+            hub.release_node(node)
+            self.respond(
+                500, {'value': {'error': 'session not created', 'message': node.url}}
+            )
+            return
+        if not session_id:
+            hub.release_node(node)
+        else:
+            with hub.condition:
+                node.session_id = session_id
+                hub.sessions[session_id] = node
+        self.respond(response.status_code, response.json())
+
+    def forward(self, method, path, body, session_id):
+        hub = self.server
+        with hub.condition:
+            node = hub.sessions.get(session_id)
+            hub.commands += 1
+        if node is None:
+            self.respond(
+                404, {'value': {'error': 'invalid session id', 'message': session_id}}
+            )
+            return
+        node.last_used = time.monotonic()
+        response = requests.request(
+            method,
+            node.url + path,
+            json=body if method == 'POST' else None,
+            timeout=settings.VERY_LONG_TIMEOUT,
+        )
+        if method == 'DELETE' and path.strip('/') == 'session/' + session_id:
+            hub.release_node(node)
+        self.send_response(response.status_code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(response.content)))
+        self.end_headers()
+        self.wfile.write(response.content)
+
+    def respond(self, status, value):
+        content = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def status(hub_url):
+    """Return the queue and throughput stats reported by the hub at `hub_url`."""
+    response = requests.get(hub_url.rstrip('/') + '/status', timeout=settings.TIMEOUT)
+    response.raise_for_status()
+    return response.json()['value']
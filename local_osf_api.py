@@ -0,0 +1,492 @@
+"""A local stand-in for the parts of the OSF v2 api that this project uses.
+
+Start it with `invoke local_osf_api` and run with DOMAIN=local, which points the api
+and files domains at it. The server keeps users, projects, files, collections,
+draft registrations and the lists of providers, institutions and waffle flags in
+memory, so the api helpers, the data pool, retries and concurrency can be exercised
+and benchmarked without the network and without touching a real OSF environment.
+Browser tests still need a real OSF to load pages from.
+
+Every response can be delayed by `latency` seconds, and a share `error_rate` of the
+requests is answered with `error_status` instead, picked by a random generator seeded
+with `seed` so that runs are repeatable. Lists are paginated with `page` and
+`page[size]`, and support `filter[<attribute>]` and `fields[<type>]` like the real api.
+Paths the server doesn't know are answered with a JSON:API 404, and methods it doesn't
+support on a known path with a 405.
+"""
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 10
+
+# Data the server starts with: providers by type, institutions, waffle flags and the
+# registration schemas of every registration provider
+PROVIDERS = {
+    'preprints': ['osf', 'selpremod', 'engrxiv'],
+    'registrations': ['osf', 'egap'],
+    'collections': ['selenium', 'characterlab'],
+}
+INSTITUTIONS = ['cos', 'nd', 'ucla']
+WAFFLE_FLAGS = {'ember_home_page': True, 'ember_auth_register': False}
+SCHEMAS = ['Open-Ended Registration', 'OSF Preregistration']
+
+
+def resource(type, id, attributes, relationships=None, links=None):
+    return {
+        'id': id,
+        'type': type,
+        'attributes': attributes,
+        'relationships': relationships or {},
+        'links': links or {},
+    }
+
+
+def related(href):
+    return {'links': {'related': {'href': href}}}
+
+
+class LocalOSFApi(ThreadingHTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+        self,
+        address,
+        latency=0.0,
+        error_rate=0.0,
+        error_status=503,
+        seed=0,
+        user='Selenium Test User',
+    ):
+        super().__init__(address, LocalOSFApiHandler)
+        self.url = 'http://{}:{}'.format(*self.server_address)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+
+        self.user = resource(
+            'users',
+            'usr01',
+            {'full_name': user, 'given_name': user.split()[0]},
+            {
+                'nodes': related(self.url + '/v2/users/usr01/nodes/'),
+                'institutions': related(self.url + '/v2/users/usr01/institutions/'),
+            },
+            {'self': self.url + '/v2/users/usr01/'},
+        )
+        self.nodes = {}
+        self.files = {}
+        self.collections = {}
+        self.draft_registrations = {}
+        self.providers = {
+            type: [
+                resource(
+                    type, name, {'name': name.title(), 'allow_submissions': True}
+                )
+                for name in names
+            ]
+            for type, names in PROVIDERS.items()
+        }
+        self.institutions = [
+            resource('institutions', id, {'name': id.upper() + ' University'})
+            for id in INSTITUTIONS
+        ]
+        self.waffle = [
+            resource('waffle', name, {'name': name, 'active': active})
+            for name, active in WAFFLE_FLAGS.items()
+        ]
+        self.schemas = [
+            resource('registration-schemas', 'schema{}'.format(i), {'name': name})
+            for i, name in enumerate(SCHEMAS)
+        ]
+        # The newest first, like the real api
+        self.registrations = [
+            resource(
+                'registrations',
+                'reg0{}'.format(i),
+                {'public': public, 'revision_state': state, 'withdrawn': withdrawn},
+            )
+            for i, (public, state, withdrawn) in enumerate(
+                [
+                    (True, 'approved', True),
+                    (False, 'approved', False),
+                    (True, 'in_progress', False),
+                    (True, 'approved', False),
+                ]
+            )
+        ]
+        self.preprints = [
+            resource('preprints', 'pre0{}'.format(i), {'is_published': published})
+            for i, published in enumerate([False, True, True])
+        ]
+
+    def new_id(self, prefix):
+        return '{}{:03d}'.format(prefix, next(self.ids))
+
+    def inject(self):
+        """Count a request, wait `latency` seconds and return the error status it
+        should be answered with, if any.
+        """
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return self.error_status if failed else None
+
+    def stats(self):
+        with self.lock:
+            elapsed = time.monotonic() - self.started
+            return {
+                'requests': self.requests,
+                'errors': self.errors,
+                'nodes': len(self.nodes),
+                'requests_per_second': self.requests / elapsed,
+            }
+
+    def serve_forever(self):
+        logger.info(
+            'Local OSF api listening on %s, with %.3fs latency and %.0f%% errors',
+            self.url,
+            self.latency,
+            self.error_rate * 100,
+        )
+        super().serve_forever()
+
+
+class LocalOSFApiHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def do_PUT(self):
+        self.route('PUT')
+
+    def do_PATCH(self):
+        self.route('PATCH')
+
+    def do_DELETE(self):
+        self.route('DELETE')
+
+    def route(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        try:
+            self.body = json.loads(body or b'{}')
+        except ValueError:
+            self.body = {}
+        parts = [part for part in url.path.split('/') if part]
+
+        status = self.server.inject()
+        if status:
+            return self.respond(status, {'errors': [{'detail': 'Injected error'}]})
+        if parts[:1] == ['v1']:
+            return self.files_domain(method, parts[1:])
+        if parts[:1] != ['v2'] or len(parts) < 2:
+            return self.not_found()
+
+        with self.server.lock:
+            handler = getattr(self, '{}_{}'.format(method.lower(), parts[1]), None)
+            if handler is None:
+                allowed = [
+                    other
+                    for other in ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+                    if hasattr(self, '{}_{}'.format(other.lower(), parts[1]))
+                ]
+                if allowed:
+                    return self.method_not_allowed(allowed)
+                return self.not_found()
+            return handler(*parts[2:])
+
+    # Users
+
+    def get_users(self, user_id=None, relationship=None, *rest):
+        server = self.server
+        if user_id is None:
+            return self.respond_list([server.user])
+        if user_id not in ['me', server.user['id']]:
+            return self.not_found()
+        if 'Authorization' not in self.headers:
+            return self.respond(401, {'errors': [{'detail': 'Not authenticated'}]})
+        if relationship is None:
+            return self.respond(200, {'data': server.user})
+        if relationship == 'nodes':
+            return self.respond_list(list(server.nodes.values()))
+        if relationship == 'institutions':
+            return self.respond_list(server.institutions[:1])
+        return self.not_found()
+
+    # Projects, their files, forks and draft registrations
+
+    def post_nodes(self, node_id=None, relationship=None, *rest):
+        server = self.server
+        data = self.body.get('data') or {}
+        if node_id is None:
+            attributes = dict(data.get('attributes') or {})
+            node_id = server.new_id('nod')
+            attributes.setdefault('tags', [])
+            attributes.setdefault('public', False)
+            attributes['current_user_permissions'] = ['admin', 'write', 'read']
+            node = resource(
+                'nodes',
+                node_id,
+                attributes,
+                {
+                    'files': related(
+                        '{}/v2/nodes/{}/files/'.format(server.url, node_id)
+                    )
+                },
+                {'self': '{}/v2/nodes/{}/'.format(server.url, node_id)},
+            )
+            server.nodes[node_id] = node
+            server.files[node_id] = []
+            return self.respond(201, {'data': node})
+        if node_id not in server.nodes:
+            return self.not_found()
+        if relationship == 'draft_registrations':
+            draft_id = server.new_id('drf')
+            draft = resource(
+                'draft_registrations',
+                draft_id,
+                {'node': node_id},
+                links={
+                    'self': '{}/v2/draft_registrations/{}/'.format(
+                        server.url, draft_id
+                    )
+                },
+            )
+            server.draft_registrations[draft_id] = draft
+            return self.respond(201, {'data': draft})
+        return self.not_found()
+
+    def get_nodes(self, node_id=None, relationship=None, provider=None, *rest):
+        server = self.server
+        if node_id is None:
+            return self.respond_list(list(server.nodes.values()))
+        node = server.nodes.get(node_id)
+        if node is None:
+            return self.not_found()
+        if relationship is None:
+            return self.respond(200, {'data': node})
+        if relationship == 'files' and provider is None:
+            return self.respond_list(
+                [resource('files', 'osfstorage', {'provider': 'osfstorage'})]
+            )
+        if relationship == 'files':
+            return self.respond_list(server.files[node_id])
+        if relationship in ['forks', 'preprints']:
+            return self.respond_list([])
+        if relationship == 'draft_registrations':
+            return self.respond_list(
+                [
+                    draft
+                    for draft in server.draft_registrations.values()
+                    if draft['attributes']['node'] == node_id
+                ]
+            )
+        return self.not_found()
+
+    def delete_nodes(self, node_id=None, *rest):
+        if node_id is None:
+            return self.method_not_allowed(['GET', 'POST'])
+        if self.server.nodes.pop(node_id, None) is None:
+            return self.not_found()
+        self.server.files.pop(node_id, None)
+        return self.respond(204)
+
+    def get_draft_registrations(self, draft_id=None, *rest):
+        server = self.server
+        if draft_id is None:
+            return self.respond_list(list(server.draft_registrations.values()))
+        draft = server.draft_registrations.get(draft_id)
+        if draft is None or rest:
+            return self.not_found()
+        return self.respond(200, {'data': draft})
+
+    def delete_draft_registrations(self, draft_id=None, *rest):
+        if draft_id is None:
+            return self.method_not_allowed(['GET'])
+        if self.server.draft_registrations.pop(draft_id, None) is None:
+            return self.not_found()
+        return self.respond(204)
+
+    def files_domain(self, method, parts):
+        """Upload and delete files like /v1/resources/<node>/providers/<provider>/ of
+        the files domain.
+        """
+        server = self.server
+        if len(parts) < 4 or parts[0] != 'resources' or parts[2] != 'providers':
+            return self.not_found()
+        node_id, provider = parts[1], parts[3]
+        with server.lock:
+            files = server.files.get(node_id)
+            if files is None:
+                return self.not_found()
+            if method == 'PUT' and self.query.get('kind') == 'file':
+                file_id = server.new_id('fil')
+                url = '{}/v1/resources/{}/providers/{}/{}'.format(
+                    server.url, node_id, provider, file_id
+                )
+                file = resource(
+                    'files',
+                    file_id,
+                    {'kind': 'file', 'name': self.query.get('name', file_id)},
+                    links={'delete': url, 'upload': url},
+                )
+                files.append(file)
+                return self.respond(201, {'data': file})
+            if method == 'DELETE' and len(parts) > 4:
+                server.files[node_id] = [
+                    file for file in files if file['id'] != parts[4]
+                ]
+                return self.respond(204)
+        return self.not_found()
+
+    # Collections
+
+    def get_collections(self, *rest):
+        return self.respond_list(list(self.server.collections.values()))
+
+    def post_collections(self, *rest):
+        server = self.server
+        collection_id = server.new_id('col')
+        attributes = dict((self.body.get('data') or {}).get('attributes') or {})
+        attributes['bookmarks'] = False
+        collection = resource('collections', collection_id, attributes)
+        server.collections[collection_id] = collection
+        return self.respond(201, {'data': collection})
+
+    def delete_collections(self, collection_id=None, *rest):
+        if collection_id is None:
+            return self.method_not_allowed(['GET', 'POST'])
+        if self.server.collections.pop(collection_id, None) is None:
+            return self.not_found()
+        return self.respond(204)
+
+    # Read-only lists
+
+    def get_providers(self, type=None, provider_id=None, relationship=None, *rest):
+        providers = self.server.providers.get(type)
+        if providers is None:
+            return self.not_found()
+        if provider_id is None:
+            return self.respond_list(providers)
+        provider = next((p for p in providers if p['id'] == provider_id), None)
+        if provider is None:
+            return self.not_found()
+        if relationship is None:
+            return self.respond(200, {'data': provider})
+        if relationship == 'schemas':
+            return self.respond_list(self.server.schemas)
+        if relationship == 'preprints':
+            return self.respond_list(self.server.preprints)
+        return self.not_found()
+
+    def get_institutions(self, *rest):
+        return self.respond_list(self.server.institutions)
+
+    def get__waffle(self, *rest):
+        return self.respond_list(self.server.waffle)
+
+    def get_registrations(self, *rest):
+        return self.respond_list(self.server.registrations)
+
+    def get_preprints(self, *rest):
+        return self.respond_list(self.server.preprints)
+
+    # Responses
+
+    def respond_list(self, items):
+        """Respond with one page of `items`, after applying the request's
+        `filter[<attribute>]` and `fields[<type>]` parameters.
+        """
+        for key, value in self.query.items():
+            if key.startswith('filter['):
+                name = key[len('filter[') : -1]
+                items = [item for item in items if matches(item, name, value)]
+        size = int(self.query.get('page[size]', DEFAULT_PAGE_SIZE))
+        page = int(self.query.get('page', 1))
+        page_items = items[(page - 1) * size : page * size]
+
+        next_url = None
+        if page * size < len(items):
+            query = dict(self.query, page=page + 1)
+            next_url = '{}{}?{}'.format(
+                self.server.url,
+                urllib.parse.urlsplit(self.path).path,
+                urllib.parse.urlencode(query),
+            )
+        self.respond(
+            200,
+            {
+                'data': [self.sparse(item) for item in page_items],
+                'links': {'next': next_url, 'meta': {'total': len(items)}},
+                'meta': {'total': len(items), 'per_page': size},
+            },
+        )
+
+    def sparse(self, item):
+        """Return `item` with only the attributes listed in `fields[<its type>]`."""
+        fields = self.query.get('fields[{}]'.format(item['type']))
+        if not fields:
+            return item
+        names = fields.split(',')
+        attributes = {
+            name: value for name, value in item['attributes'].items() if name in names
+        }
+        return dict(item, attributes=attributes, relationships={})
+
+    def not_found(self):
+        self.respond(404, {'errors': [{'detail': 'Not found.'}]})
+
+    def method_not_allowed(self, allowed):
+        self.respond(
+            405,
+            {'errors': [{'detail': 'Method not allowed.'}]},
+            {'Allow': ', '.join(allowed)},
+        )
+
+    def respond(self, status, value=None, headers=None):
+        content = json.dumps(value).encode() if value is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.api+json; charset=utf-8')
+        self.send_header('Content-Length', str(len(content)))
+        for header in (headers or {}).items():
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def matches(item, name, value):
+    """Return True if the attribute `name` of `item` matches the filter `value`."""
+    if name == 'id':
+        return item['id'] in value.split(',')
+    attribute = item['attributes'].get(name)
+    if isinstance(attribute, list):
+        return value in attribute
+    if isinstance(attribute, bool):
+        return attribute == (value.lower() == 'true')
+    return str(attribute) == value
@@ -1,18 +1,107 @@
 import urllib.parse
+from collections import Counter
 from time import sleep
 
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import (
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+    WebDriverException,
+)
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
 
+import request_blocker
 import settings
+import spans
 from base.exceptions import HttpError, PageException
 from base.locators import BaseElement, ComponentLocator
 from components.navbars import HomeNavbar
+from spans import span
+
+# Tally of how `goto` reached its pages over the course of a test run
+navigation_stats = Counter()
+# Urls `goto` was asked for during the current test, recorded in the page manifest
+visited_urls = []
+# Set while a failed test is re-run, so that `goto` always loads its pages afresh
+# instead of reusing what the failed attempt left in the browser
+force_navigation = False
+
+# document.readyState values in the order the browser goes through them
+READY_STATES = ['loading', 'interactive', 'complete']
+
+# Ask the running Ember app's router to transition to the url in arguments[0]. Returns
+# false when there is no Ember app on the page or its router does not own the url.
+EMBER_TRANSITION_SCRIPT = """
+var url = arguments[0];
+var require = window.requirejs;
+if (!require || !require.has('ember')) { return false; }
+var Ember = require('ember').default;
+var app = Ember.Namespace.NAMESPACES.find(function (namespace) {
+    return namespace instanceof Ember.Application;
+});
+var instance = app && app.__deprecatedInstance__;
+if (!instance || instance.isDestroyed) { return false; }
+var router = instance.lookup('service:router');
+if (!router.recognize) { return false; }
+var route = router.recognize(url);
+if (!route || route.name === 'not-found') { return false; }
+router.transitionTo(url).catch(function () {});
+return true;
+"""
+
+# Mark the document as reached by `goto` for the url in arguments[0], and from then on
+# flag it as touched by any click, key press or form input
+MARK_PAGE_SCRIPT = """
+window.__gotoUrl = arguments[0];
+window.__gotoTouched = false;
+if (!window.__gotoListening) {
+    window.__gotoListening = true;
+    ['click', 'keydown', 'input', 'change', 'submit'].forEach(function (type) {
+        document.addEventListener(type, function () {
+            window.__gotoTouched = true;
+        }, true);
+    });
+}
+"""
+
+# Return true if `goto` reached the document for the url in arguments[0] and nothing has
+# interacted with it since
+UNTOUCHED_PAGE_SCRIPT = """
+return window.__gotoUrl === arguments[0] && window.__gotoTouched === false;
+"""
+
+
+def normalize_url(url):
+    """Return `url` in a canonical form so that equivalent urls compare equal:
+    lowercase scheme and host, no trailing slash, sorted query parameters and no
+    empty fragment.
+    """
+    parts = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(
+        sorted(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    )
+    return urllib.parse.urlunsplit(
+        (
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path.rstrip('/') or '/',
+            query,
+            parts.fragment,
+        )
+    )
 
 
 class BasePage(BaseElement):
     url = None
+    # Set to True on pages whose third-party content is part of the accessibility scan
+    # so that REQUEST_BLOCKING doesn't block it
+    third_party_in_scope = False
+    # The document.readyState the page has to reach before it is checked. Pages
+    # whose content depends on iframes or other late resources should wait for
+    # 'complete', which PAGE_LOAD_STRATEGY 'eager' no longer waits for.
+    ready_state = 'interactive'
 
     def __init__(self, driver, verify=False):
         super().__init__(driver)
@@ -20,25 +109,54 @@ class BasePage(BaseElement):
         if verify:
             self.check_page()
 
-    def goto(self, expect_redirect_to=None):
+    def goto(self, expect_redirect_to=None, force=False):
         """Navigate to a page based on its `url` attribute
         and confirms you are on the expected page.
 
         If you are not actually expecting to end up on the page you attempt to `goto`
         (for example when testing permissions) you can set `expect_redirect_to` equal to
         any BasePage class and it will be verified you wind up on that page instead.
+
+        If the browser has already finished loading this page through `goto`, and
+        nothing has clicked, typed or submitted anything on it since, the navigation is
+        skipped. When `settings.EMBER_TRANSITIONS` is on and the Ember app is already
+        running, the page is reached through the Ember router instead of a full page
+        load. Set `force` to True to always reload the page, as re-runs of failed tests
+        do.
         """
+        request_blocker.set_page(
+            type(self).__name__, enabled=not self.third_party_in_scope
+        )
+        visited_urls.append(self.url)
+        spans.current_page = type(self).__name__
+        if not (force or force_navigation or expect_redirect_to):
+            with span('navigation'):
+                if self.is_loaded():
+                    navigation_stats['avoided'] += 1
+                    return
+                if settings.EMBER_TRANSITIONS and self.ember_transition():
+                    navigation_stats['transitioned'] += 1
+                    self.mark_page()
+                    return
 
-        self.driver.get(self.url)
+        with span('navigation'):
+            self.driver.get(self.url)
+        navigation_stats['loaded'] += 1
+        with span('readiness'):
+            self.wait_until_ready()
 
-        if expect_redirect_to:
-            if self.url not in self.driver.current_url:
-                raise PageException(
-                    'Unexpected url structure: `{}`'.format(self.driver.current_url)
-                )
-            expect_redirect_to(self.driver, verify=True)
-        else:
-            self.check_page()
+        with span('identity'):
+            if expect_redirect_to:
+                if self.url not in self.driver.current_url:
+                    raise PageException(
+                        'Unexpected url structure: `{}`'.format(
+                            self.driver.current_url
+                        )
+                    )
+                expect_redirect_to(self.driver, verify=True)
+            else:
+                self.check_page()
+                self.mark_page()
 
     def goto_with_reload(self):
         """An extension of the goto method above to be used in instances where the first attempt
@@ -48,16 +166,95 @@ class BasePage(BaseElement):
         having while running the nightly Selenium test suites in BrowserStack.  It does not replace
         the existing goto method that is called by most of the Selenium tests.  This method will
         only be called by tests that experience page loading timeout issues in BrowserStack.
-        (ex: test_navbar.py)
+        (ex: test_navbar.py)  If the reload succeeded in loading the page, the page is
+        marked as reached by `goto` instead of being navigated to a second time.
         """
         try:
             self.goto()
         except PageException:
             self.reload()
+            with span('readiness'):
+                self.wait_until_ready()
+            if (
+                normalize_url(self.driver.current_url) == normalize_url(self.url)
+                and self.verify()
+            ):
+                self.mark_page()
+                return
             self.goto()
 
+    def is_loaded(self):
+        """Return True if the browser is already on this page's url as `goto` left it,
+        with nothing clicked, typed or submitted since, the document has reached the
+        page's `ready_state`, and the page's `identity` element is present.
+        """
+        url = normalize_url(self.url)
+        if normalize_url(self.driver.current_url) != url:
+            return False
+        try:
+            if not self.driver.execute_script(UNTOUCHED_PAGE_SCRIPT, url):
+                return False
+        except WebDriverException:
+            return False
+        if not self.is_ready():
+            return False
+        return self.verify()
+
+    def mark_page(self):
+        """Mark the document as reached by `goto`, for `is_loaded`."""
+        try:
+            self.driver.execute_script(MARK_PAGE_SCRIPT, normalize_url(self.url))
+        except WebDriverException:
+            pass
+
+    def is_ready(self):
+        """Return True if the document has reached the page's `ready_state`."""
+        state = self.driver.execute_script('return document.readyState')
+        return READY_STATES.index(state) >= READY_STATES.index(self.ready_state)
+
+    def wait_until_ready(self):
+        """Wait for the document to reach the page's `ready_state`. A page that never
+        gets there is left for `check_page` to report.
+        """
+        try:
+            WebDriverWait(self.driver, settings.TIMEOUT).until(
+                lambda driver: self.is_ready()
+            )
+        except TimeoutException:
+            pass
+
+    def ember_transition(self):
+        """Reach this page with an in-app transition of the Ember app that is already
+        loaded in the browser. Return True if the transition settled on this page, or
+        False if a full page load is needed instead.
+        """
+        current = urllib.parse.urlsplit(self.driver.current_url)
+        target = urllib.parse.urlsplit(self.url)
+        if (current.scheme, current.netloc) != (target.scheme, target.netloc):
+            return False
+
+        path = urllib.parse.urlunsplit(('', '', target.path, target.query, ''))
+        # The script relies on private Ember apis, so if the app or its version doesn't
+        # support it the page is loaded in full instead
+        try:
+            if not self.driver.execute_script(EMBER_TRANSITION_SCRIPT, path):
+                return False
+        except WebDriverException:
+            return False
+
+        try:
+            WebDriverWait(self.driver, settings.TIMEOUT).until(
+                lambda driver: normalize_url(driver.current_url)
+                == normalize_url(self.url)
+            )
+        except TimeoutException:
+            return False
+        return self.verify()
+
     def check_page(self):
-        if not self.verify():
+        with span('identity'):
+            verified = self.verify()
+        if not verified:
             # handle any specific kind of error before go to page exception
             self.error_handling()
             raise PageException(
@@ -81,6 +278,31 @@ class BasePage(BaseElement):
         # Account for navbar
         self.driver.execute_script('window.scrollBy(0, 55)')
 
+    def select_power_select_option(self, search_input, text=None):
+        """Type `text` into the search input of an open ember-power-select and pick the
+        option that reads exactly `text`, or pick the first option if `text` is None.
+        """
+        selector = '.ember-power-select-option'
+        if text is None:
+            self.driver.find_element(By.CSS_SELECTOR, selector).click()
+            return
+        search_input.send_keys(text)
+        option = WebDriverWait(
+            self.driver,
+            settings.TIMEOUT,
+            ignored_exceptions=[StaleElementReferenceException],
+        ).until(
+            lambda driver: next(
+                (
+                    option
+                    for option in driver.find_elements(By.CSS_SELECTOR, selector)
+                    if option.text.strip() == text
+                ),
+                False,
+            )
+        )
+        option.click()
+
     def drag_and_drop(self, source_element, dest_element):
         source_element.click()
         ActionChains(self.driver).drag_and_drop(source_element, dest_element).perform()
@@ -45,6 +45,9 @@ class CollectionSubmitPage(BaseCollectionPage):
     project_help_text = Locator(
         By.CSS_SELECTOR, '.ember-power-select-option--search-message'
     )
+    project_selector_input = Locator(
+        By.CSS_SELECTOR, 'input[class="ember-power-select-search-input"]'
+    )
     project_selector_project = Locator(By.CSS_SELECTOR, '.ember-power-select-option')
     project_metadata_save = Locator(
         By.CSS_SELECTOR, '[data-test-project-metadata-save-button]'
@@ -143,6 +143,16 @@ class CASAuthorizationPage(BasePage):
     deny_button = Locator(By.ID, 'deny')
 
 
+# The OSF and CAS cookies of each user's last successful login, keyed by user
+session_cookies = {}
+
+# Cookies that are not part of a login session and survive logging out
+PERSISTENT_COOKIES = ['osf_cookieconsent']
+
+# Cookie keys that `add_cookie` accepts across browsers
+COOKIE_KEYS = ['name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry']
+
+
 def login(driver, user=settings.USER_ONE, password=settings.USER_ONE_PASSWORD):
     login_page = LoginPage(driver)
     login_page.goto()
@@ -150,12 +160,74 @@ def login(driver, user=settings.USER_ONE, password=settings.USER_ONE_PASSWORD):
 
 
 def safe_login(driver, user=settings.USER_ONE, password=settings.USER_ONE_PASSWORD):
-    """Raise a LoginError if login fails."""
+    """Raise a LoginError if login fails.
+
+    With LOGIN_SESSION_CACHE on, the cookies saved from the user's last login are
+    restored instead, and the login form is only used when that session has expired.
+    """
+    if settings.LOGIN_SESSION_CACHE and restore_session(driver, user):
+        return
     login(driver, user=user, password=password)
     if not OSFBasePage(driver).is_logged_in():
         raise LoginError('Login failed')
+    if settings.LOGIN_SESSION_CACHE:
+        save_session(driver, user)
 
 
 def logout(driver):
-    """Log the user out."""
+    """Log the user out.
+
+    With LOGIN_SESSION_CACHE on, only the session cookies are cleared from the browser
+    so that the session itself can be restored by a later `safe_login`. If a cookie
+    that isn't visible on OSF_HOME or CAS_DOMAIN keeps the user logged in, the user is
+    logged out through /logout/ after all, which ends the saved sessions on the server.
+    """
+    if settings.LOGIN_SESSION_CACHE:
+        for domain in [settings.OSF_HOME, settings.CAS_DOMAIN]:
+            _set_session_cookies(driver, domain, [])
+        driver.get(settings.OSF_HOME)
+        if not OSFBasePage(driver).is_logged_in():
+            return
+        session_cookies.clear()
     driver.get(settings.OSF_HOME + '/logout/')
+
+
+def save_session(driver, user):
+    """Save the OSF and CAS cookies of the logged in `user`."""
+    cookies = {}
+    for domain in [settings.OSF_HOME, settings.CAS_DOMAIN]:
+        # Cookies can only be read from a page on their own domain
+        driver.get(domain + '/favicon.ico')
+        cookies[domain] = [
+            cookie
+            for cookie in driver.get_cookies()
+            if cookie['name'] not in PERSISTENT_COOKIES
+        ]
+    session_cookies[user] = cookies
+
+
+def restore_session(driver, user):
+    """Replace the browser's session cookies with the ones saved for `user` and return
+    True if that logged the user in.
+    """
+    if user not in session_cookies:
+        return False
+    for domain, cookies in session_cookies[user].items():
+        _set_session_cookies(driver, domain, cookies)
+    driver.get(settings.OSF_HOME)
+    if OSFBasePage(driver).is_logged_in():
+        return True
+    # The session has expired on the server
+    del session_cookies[user]
+    logout(driver)
+    return False
+
+
+def _set_session_cookies(driver, domain, cookies):
+    """Delete the session cookies visible on `domain` and add `cookies` instead."""
+    driver.get(domain + '/favicon.ico')
+    for cookie in driver.get_cookies():
+        if cookie['name'] not in PERSISTENT_COOKIES:
+            driver.delete_cookie(cookie['name'])
+    for cookie in cookies:
+        driver.add_cookie({key: cookie[key] for key in COOKIE_KEYS if key in cookie})
@@ -114,6 +114,8 @@ class FilesPage(GuidBasePage):
 class FileViewPage(GuidBasePage):
 
     identity = Locator(By.CSS_SELECTOR, 'h2[data-test-filename]')
+    # The file renderer is an iframe
+    ready_state = 'complete'
 
 
 class WikiPage(GuidBasePage):
@@ -8,6 +8,8 @@ from pages.base import OSFBasePage
 
 class EmberRegisterPage(OSFBasePage):
     url = settings.OSF_HOME + '/register'
+    # The sign up form's reCAPTCHA widget is scanned with the page
+    third_party_in_scope = True
 
     identity = Locator(By.CSS_SELECTOR, '._sign-up-container_19kgff')
 
@@ -20,5 +22,7 @@ class RegisterPage(OSFBasePage):
     waffle_override = {'ember_auth_register': EmberRegisterPage}
 
     url = settings.OSF_HOME + '/register'
+    # The sign up form's reCAPTCHA widget is scanned with the page
+    third_party_in_scope = True
 
     identity = Locator(By.CSS_SELECTOR, '#signUpScope')
@@ -80,6 +80,8 @@ class RegistrationFileListPage(BaseSubmittedRegistrationPage):
 
 class RegistrationFileDetailPage(GuidBasePage):
     identity = Locator(By.CSS_SELECTOR, '[data-test-file-renderer')
+    # The file renderer is an iframe
+    ready_state = 'complete'
 
 
 class RegistrationResourcesPage(BaseSubmittedRegistrationPage):
@@ -8,9 +8,11 @@ from pages.base import GuidBasePage, OSFBasePage
 
 
 class UserProfilePage(GuidBasePage):
-    user = osf_api.current_user()
-
-    def __init__(self, driver, verify=False, guid=user.id):
+    def __init__(self, driver, verify=False, guid=None):
+        # Default to the profile of USER_ONE, which is looked up on first use rather
+        # than when this module is imported
+        if guid is None:
+            guid = osf_api.current_user_cached().id
         super().__init__(driver, verify, guid)
 
     # TODO: Reconsider using a component here (and using component locators correctly)
@@ -0,0 +1,89 @@
+"""Warm the next test's page while the current test is being scanned.
+
+In a serial run the network time of the next page doesn't start until axe has
+finished with the current one. The conftest records the urls each test reaches
+through `BasePage.goto` in PAGE_MANIFEST_FILE, and before every test it tells this
+module where the next test is going to start. When the current test runs axe, the
+next test's first url is fetched into the browser's HTTP cache with `fetch()`, so its
+download overlaps with the scan. Unlike a `<link rel="prefetch">`, this leaves the
+DOM that axe audits as the app rendered it.
+
+Only urls that were the same in the last two runs are prefetched, since pages of
+projects and other data created during a test get new guids every run.
+"""
+from collections import Counter, defaultdict
+
+from selenium.common.exceptions import WebDriverException
+
+import settings
+
+# Prefetches started, finished before the scan did, and the seconds of network time
+# they took off the next test, per partition of the suite
+prefetch_stats = defaultdict(Counter)
+
+# The url to prefetch during the current test and the partition it belongs to
+next_url = None
+partition = None
+
+# Start fetching arguments[0] with the page's cookies, without waiting for it or
+# touching the DOM, and return the time it started
+PREFETCH_SCRIPT = """
+fetch(arguments[0], {credentials: 'include'}).catch(function () {});
+return performance.now();
+"""
+
+# Return [start, end] in milliseconds of the prefetch of arguments[0], with an end of
+# 0 when it is still downloading, or null when the browser didn't start it
+PREFETCH_TIMING_SCRIPT = """
+var entries = performance.getEntriesByName(arguments[0]);
+if (!entries.length) { return null; }
+var entry = entries[entries.length - 1];
+return [entry.startTime, entry.responseEnd];
+"""
+
+
+def set_next(url, test_partition):
+    """Prefetch `url` during the test that is about to run, if PREFETCH_NEXT_PAGE is
+    on. `test_partition` is the name its overlap is reported under.
+    """
+    global next_url, partition
+    next_url = url if settings.PREFETCH_NEXT_PAGE else None
+    partition = test_partition
+
+
+def prefetch(driver):
+    """Start prefetching the next test's url from the current page, at most once per
+    test. Return a token for `collect`, or None if nothing was prefetched.
+    """
+    global next_url
+    if not next_url:
+        return None
+    url, next_url = next_url, None
+    try:
+        started = driver.execute_script(PREFETCH_SCRIPT, url)
+    except WebDriverException:
+        return None
+    prefetch_stats[partition]['prefetched'] += 1
+    return url, started
+
+
+def collect(driver, token):
+    """Record how much of the prefetch started by `prefetch` overlapped with the scan
+    that has just finished.
+    """
+    if token is None:
+        return
+    url, started = token
+    try:
+        timing = driver.execute_script(PREFETCH_TIMING_SCRIPT, url)
+        now = driver.execute_script('return performance.now();')
+    except WebDriverException:
+        return
+    if not timing:
+        return
+    start, end = timing
+    if end:
+        prefetch_stats[partition]['finished'] += 1
+    else:
+        end = now
+    prefetch_stats[partition]['overlap_seconds'] += max(end - max(start, started), 0) / 1000
@@ -0,0 +1,219 @@
+"""A local HTTP proxy that keeps the browser from loading third-party requests.
+
+Analytics, fonts and tracking scripts don't affect the accessibility checks but slow
+down every page load. `launch_driver` routes local browsers through this proxy when
+REQUEST_BLOCKING is on, and the proxy refuses connections to hosts that match
+REQUEST_DENYLIST unless they belong to the environment under test or match
+REQUEST_ALLOWLIST.
+
+The proxy only sees the host of https requests, so blocking works per domain, and it
+can't tell how large a blocked response would have been. It counts the requests it
+blocked on each page, as labelled by `BasePage.goto`, and estimates the bytes that
+saved from the requests to the same hosts it let through on pages that opt out of
+blocking.
+"""
+import fnmatch
+import logging
+import select
+import socket
+import socketserver
+import threading
+import urllib.parse
+from collections import Counter, defaultdict
+
+import settings
+
+logger = logging.getLogger(__name__)
+
+# Requests blocked and the bytes that saved, per page. Requests to hosts the proxy never
+# let through are counted as 'unsized' instead.
+blocking_stats = defaultdict(Counter)
+
+
+def environment_hosts():
+    """Return the hosts of the OSF environment under test."""
+    domain = settings.domains[settings.DOMAIN]
+    urls = [domain['home'], domain['api'], domain['files'], domain['cas']]
+    urls += domain['custom_institution_domains']
+    return [urllib.parse.urlsplit(url).hostname for url in urls]
+
+
+def is_blocked(host):
+    """Return True if requests to `host` should be blocked."""
+    host = host.lower()
+    allowed = environment_hosts() + settings.REQUEST_ALLOWLIST
+    if any(fnmatch.fnmatch(host, pattern) for pattern in allowed):
+        return False
+    return any(fnmatch.fnmatch(host, pattern) for pattern in settings.REQUEST_DENYLIST)
+
+
+class BlockingProxyHandler(socketserver.StreamRequestHandler):
+    # Read unbuffered so that no bytes meant for the tunnel are left behind in a buffer
+    rbufsize = 0
+
+    def handle(self):
+        head = self.rfile.readline(65537)
+        if not head:
+            return
+        method, target, version = head.decode('latin-1').split()
+        if method == 'CONNECT':
+            host, port = target.rsplit(':', 1)
+        else:
+            url = urllib.parse.urlsplit(target)
+            host, port = url.hostname, url.port or 80
+
+        server = self.server
+        if not is_blocked(host):
+            self.forward(method, target, version, host, int(port))
+        elif not server.enabled:
+            server.measure(host, self.forward(method, target, version, host, int(port)))
+        else:
+            server.block(host)
+            self.wfile.write(b'HTTP/1.1 403 Blocked\r\nContent-Length: 0\r\n\r\n')
+
+    def forward(self, method, target, version, host, port):
+        """Pass the request on to `host` and return the number of bytes received."""
+        try:
+            upstream = socket.create_connection((host, port), timeout=settings.TIMEOUT)
+        except OSError:
+            self.wfile.write(b'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n')
+            return 0
+
+        with upstream:
+            if method == 'CONNECT':
+                # Skip the rest of the CONNECT request and tunnel the https traffic
+                while self.rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                    pass
+                self.wfile.write(b'HTTP/1.1 200 Connection Established\r\n\r\n')
+            else:
+                # Send the request upstream in origin-form and ask the server to close
+                # the connection after responding, since the next request from the
+                # browser may be for a different host
+                url = urllib.parse.urlsplit(target)
+                path = urllib.parse.urlunsplit(('', '', url.path or '/', url.query, ''))
+                request = ['{} {} {}\r\n'.format(method, path, version)]
+                length = 0
+                for line in iter(lambda: self.rfile.readline(65537), b''):
+                    header = line.decode('latin-1')
+                    if header in ('\r\n', '\n'):
+                        break
+                    if header.lower().startswith('content-length:'):
+                        length = int(header.split(':', 1)[1])
+                    if not header.lower().startswith(('connection:', 'proxy-')):
+                        request.append(header)
+                request.append('Connection: close\r\n\r\n')
+                upstream.sendall(''.join(request).encode('latin-1'))
+                while length > 0:
+                    body = self.rfile.read(min(length, 65536))
+                    if not body:
+                        break
+                    upstream.sendall(body)
+                    length -= len(body)
+                return self.relay(upstream)
+            return self.tunnel(upstream)
+
+    def relay(self, upstream):
+        """Send the response from `upstream` to the browser, and then close the
+        browser's connection. A further request on it would otherwise be passed to
+        `upstream` without being checked against the denylist. Return the number of
+        bytes received.
+        """
+        upstream.settimeout(settings.VERY_LONG_TIMEOUT)
+        received = 0
+        try:
+            for data in iter(lambda: upstream.recv(65536), b''):
+                received += len(data)
+                self.connection.sendall(data)
+        except OSError:
+            pass
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return received
+
+    def tunnel(self, upstream):
+        """Pipe bytes between the browser and `upstream` until either side closes, and
+        return the number of bytes received from `upstream`.
+        """
+        client = self.connection
+        sockets = [client, upstream]
+        received = 0
+        while True:
+            readable, _, errored = select.select(
+                sockets, [], sockets, settings.VERY_LONG_TIMEOUT
+            )
+            if errored or not readable:
+                break
+            for sock in readable:
+                data = sock.recv(65536)
+                if not data:
+                    return received
+                if sock is upstream:
+                    received += len(data)
+                    client.sendall(data)
+                else:
+                    upstream.sendall(data)
+        return received
+
+
+class BlockingProxy(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0)):
+        super().__init__(address, BlockingProxyHandler)
+        self.enabled = True
+        self.page = None
+        self.lock = threading.Lock()
+        # Bytes received from, and requests let through to, each host that is blocked
+        # unless the page opts out
+        self.host_bytes = Counter()
+        self.host_requests = Counter()
+
+    @property
+    def address(self):
+        return '{}:{}'.format(*self.server_address)
+
+    def measure(self, host, received):
+        """Record a request to a blocked host that was let through."""
+        with self.lock:
+            self.host_bytes[host] += received
+            self.host_requests[host] += 1
+
+    def block(self, host):
+        """Record a blocked request, and the average size of the requests to `host`
+        that were let through as the bytes it saved.
+        """
+        with self.lock:
+            counts = blocking_stats[self.page or 'other']
+            counts['blocked'] += 1
+            if self.host_requests[host]:
+                counts['saved_bytes'] += (
+                    self.host_bytes[host] // self.host_requests[host]
+                )
+            else:
+                counts['unsized'] += 1
+
+
+# The proxy for this process, started by the first call to `start`
+proxy = None
+
+
+def start():
+    """Start the proxy in a background thread, if it isn't running yet, and return
+    its 'host:port' address.
+    """
+    global proxy
+    if proxy is None:
+        proxy = BlockingProxy()
+        threading.Thread(target=proxy.serve_forever, daemon=True).start()
+        logger.info('Request blocking proxy listening on %s', proxy.address)
+    return proxy.address
+
+
+def set_page(page, enabled=True):
+    """Attribute the traffic from now on to `page`, and turn blocking on or off."""
+    if proxy is not None:
+        proxy.page = page
+        proxy.enabled = enabled
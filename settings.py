@@ -1,3 +1,5 @@
+import os
+
 from environs import Env
 
 env = Env()
@@ -32,6 +34,14 @@ domains = {
         'cas': 'https://accounts.test.osf.io',
         'custom_institution_domains': [],
     },
+    # The stand-in api of `invoke local_osf_api`, which also serves the files domain
+    'local': {
+        'home': env('LOCAL_OSF_API_URL', 'http://localhost:8000'),
+        'api': env('LOCAL_OSF_API_URL', 'http://localhost:8000'),
+        'files': env('LOCAL_OSF_API_URL', 'http://localhost:8000'),
+        'cas': env('LOCAL_OSF_API_URL', 'http://localhost:8000'),
+        'custom_institution_domains': [],
+    },
     'prod': {
         'home': 'https://osf.io',
         'api': 'https://api.osf.io',
@@ -58,6 +68,69 @@ domains = {
 
 DRIVER = env('DRIVER', 'Firefox')
 HEADLESS = env.bool('HEADLESS', False)
+# Width and height of headless browser windows. Match the screen of headed runs so
+# that both lay pages out the same way.
+WINDOW_SIZE = [int(size) for size in env.list('WINDOW_SIZE', ['1920', '1080'])]
+
+# Address ('host:port') of a running browser daemon to lease warm browsers from
+BROWSER_DAEMON = env('BROWSER_DAEMON', None)
+# Secret that test runs authenticate to the daemon with. Unless it is set, the daemon
+# generates a random one when it starts and writes it to BROWSER_DAEMON_KEY_FILE.
+BROWSER_DAEMON_KEY = env('BROWSER_DAEMON_KEY', None)
+BROWSER_DAEMON_KEY_FILE = env(
+    'BROWSER_DAEMON_KEY_FILE', os.path.expanduser('~/.cache/selenium-a11y-daemon-key')
+)
+# Number of test runs a daemon browser serves before it is replaced by a fresh one
+BROWSER_DAEMON_MAX_USES = env.int('BROWSER_DAEMON_MAX_USES', 20)
+
+# Route local browsers through a proxy that blocks third-party requests. Hosts of the
+# environment under test and those matching REQUEST_ALLOWLIST are never blocked. Off by
+# default, as third-party widgets then drop out of the accessibility scans.
+REQUEST_BLOCKING = env.bool('REQUEST_BLOCKING', False)
+REQUEST_ALLOWLIST = env.list('REQUEST_ALLOWLIST', ['osf.io', '*.osf.io', '*.cos.io'])
+REQUEST_DENYLIST = env.list(
+    'REQUEST_DENYLIST',
+    [
+        '*.google-analytics.com',
+        '*.googletagmanager.com',
+        '*.doubleclick.net',
+        'fonts.googleapis.com',
+        'fonts.gstatic.com',
+        '*.hotjar.com',
+        '*.newrelic.com',
+        '*.nr-data.net',
+        '*.sentry.io',
+        'connect.facebook.net',
+        'platform.twitter.com',
+    ],
+)
+
+# What driver.get waits for before returning: 'normal' waits for every resource on the
+# page, 'eager' only for the DOM to be ready. Pages wait for the readiness they need
+# themselves (see `BasePage.ready_state`). Can be set per browser.
+PAGE_LOAD_STRATEGY = env('PAGE_LOAD_STRATEGY', 'normal')
+PAGE_LOAD_STRATEGIES = {
+    driver_name: env(
+        '{}_PAGE_LOAD_STRATEGY'.format(driver_name.upper()), PAGE_LOAD_STRATEGY
+    )
+    for driver_name in ['Chrome', 'Firefox', 'Edge', 'Remote']
+}
+
+# Keep each local browser's HTTP cache between runs, per browser and DOMAIN
+BROWSER_CACHE = env.bool('BROWSER_CACHE', False)
+BROWSER_CACHE_DIR = env(
+    'BROWSER_CACHE_DIR', os.path.expanduser('~/.cache/selenium-a11y')
+)
+
+# Scan the public pages of branded providers and institutions several at a time, each in
+# its own tab, with at most MAX_SCAN_TABS tabs and TAB_SCANNING_MEMORY_MB of JavaScript
+# heap (only measured in Chromium based browsers) in use at once
+TAB_SCANNING = env.bool('TAB_SCANNING', False)
+MAX_SCAN_TABS = env.int('MAX_SCAN_TABS', 4)
+TAB_SCANNING_MEMORY_MB = env.int('TAB_SCANNING_MEMORY_MB', 1024)
+
+# Reach Ember pages with an in-app router transition when the Ember app is already loaded
+EMBER_TRANSITIONS = env.bool('EMBER_TRANSITIONS', False)
 
 QUICK_TIMEOUT = env.int('QUICK_TIMEOUT', 4)
 TIMEOUT = env.int('TIMEOUT', 10)
@@ -97,6 +170,24 @@ FILE_DOMAIN = domains[DOMAIN]['files']
 CAS_DOMAIN = domains[DOMAIN]['cas']
 CUSTOM_INSTITUTION_DOMAINS = domains[DOMAIN]['custom_institution_domains']
 
+# OSF api requests share one pool of keep-alive connections. At most API_MAX_CONCURRENCY
+# requests are in flight at once, and GET/PUT/DELETE requests that fail with a 429 or
+# 5xx (and POST/PATCH requests that fail with a 429) are retried up to API_RETRIES
+# times, waiting API_RETRY_BACKOFF * 2 ** retry seconds or as long as Retry-After says.
+API_MAX_CONCURRENCY = env.int('API_MAX_CONCURRENCY', 8)
+API_RETRIES = env.int('API_RETRIES', 3)
+API_RETRY_BACKOFF = env.float('API_RETRY_BACKOFF', 0.5)
+API_TIMEOUT = env.int('API_TIMEOUT', VERY_LONG_TIMEOUT)
+# Keep the responses of slow-changing api lookups (providers, institutions, waffle
+# flags, registration schemas) on disk, shared by every test process, for the TTLs in
+# osf_api.CACHE_TTLS. Off by default, as the lists may be stale until they expire.
+API_CACHE = env.bool('API_CACHE', False)
+API_CACHE_DIR = env('API_CACHE_DIR', '.api_cache')
+# Record the api traffic of each test to cassettes in API_CASSETTE_DIR ('record'), or
+# answer api requests from them without the network ('replay')
+API_RECORD_MODE = env('API_RECORD_MODE', 'off')
+API_CASSETTE_DIR = env('API_CASSETTE_DIR', 'cassettes')
+
 # Browser capabilities for browserstack testing
 caps = {
     'chrome': {
@@ -121,9 +212,16 @@ caps = {
 
 BUILD = DRIVER
 
+# WebDriver hub that DRIVER=Remote runs the tests on, BrowserStack by default
+REMOTE_HUB_URL = env('REMOTE_HUB_URL', None)
+
 if DRIVER == 'Remote':
-    BSTACK_USER = env('BSTACK_USER')
-    BSTACK_KEY = env('BSTACK_KEY')
+    if REMOTE_HUB_URL is None:
+        BSTACK_USER = env('BSTACK_USER')
+        BSTACK_KEY = env('BSTACK_KEY')
+        REMOTE_HUB_URL = 'http://{}:{}@hub.browserstack.com:80/wd/hub'.format(
+            BSTACK_USER, BSTACK_KEY
+        )
 
     BUILD = env('TEST_BUILD', 'chrome')
     DESIRED_CAP = caps[BUILD]
@@ -147,6 +245,34 @@ else:
     USER_TWO_PASSWORD = env('USER_TWO_PASSWORD')
 
 
+# Restore a user's cookies from their first login instead of logging in through the UI.
+# Off by default, as logging out then leaves the session valid on the server
+LOGIN_SESSION_CACHE = env.bool('LOGIN_SESSION_CACHE', False)
+
+# Lease projects from a pool provisioned at session start to the project fixtures,
+# instead of creating and deleting a project for every test
+DATA_POOL = env.bool('DATA_POOL', False)
+DATA_POOL_SIZE = env.int('DATA_POOL_SIZE', 1)
+DATA_POOL_KEEP = env.bool('DATA_POOL_KEEP', True)
+
+# Per-test durations recorded by each run, used to balance shards in `invoke test_shard`
+TEST_DURATIONS_FILE = env('TEST_DURATIONS_FILE', '.test_durations.json')
+
+# Prefetch the first page of the next test while the current one is scanned, using the
+# urls each test visited in previous runs as recorded in PAGE_MANIFEST_FILE
+PREFETCH_NEXT_PAGE = env.bool('PREFETCH_NEXT_PAGE', False)
+PAGE_MANIFEST_FILE = env('PAGE_MANIFEST_FILE', '.page_manifest.json')
+
+# Append the time each test spent in each phase of loading and scanning its pages to
+# this file, as one JSON line per test
+SPANS_FILE = env('SPANS_FILE', None)
+# Write a Chrome trace of the run, with fixtures, tests, api requests, WebDriver commands
+# and page phases on one track per worker, to this file
+TRACE_FILE = env('TRACE_FILE', None)
+
+# Directory that accessibility results files are written to
+A11Y_RESULTS_DIR = env('A11Y_RESULTS_DIR', 'a11y_results')
+
 # Used to skip certain tests on specific stagings
 STAGE1 = DOMAIN == 'stage1'
 STAGE2 = DOMAIN == 'stage2'
@@ -0,0 +1,185 @@
+"""Record how long each test spends in each phase of loading and scanning a page.
+
+`BasePage.goto`, the waits of `WebElementWrapper` and `ApplyA11yRules` wrap their work
+in `span(phase)`. Every span is attributed to the page class that `goto` last loaded.
+Spans can nest, for instance the identity check waits for an element, but only the
+outermost span counts towards a phase's time so that the phases add up.
+
+The conftest calls `finish_test` at the end of each test, which appends one JSON line
+per test to SPANS_FILE, if it is set, and keeps the phase times for the percentile
+summary at the end of the session.
+
+When TRACE_FILE is set, the phases, fixture setup, tests, OSF api requests and WebDriver
+commands are also recorded as Chrome trace events with `traced`. Each process writes
+its own events and the pytest-xdist controller merges them into TRACE_FILE, which can
+be opened in chrome://tracing or https://ui.perfetto.dev with one track per worker.
+"""
+import glob
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+import settings
+
+# The page class the current spans belong to, as set by `BasePage.goto`
+current_page = None
+
+# Spans of the current test, in the order they finished
+test_spans = []
+_depth = 0
+
+# Seconds of every outermost span in the session, keyed by (page class, phase)
+phase_seconds = defaultdict(list)
+
+# Chrome trace events recorded by this process
+trace_events = []
+
+
+@contextmanager
+def traced(name, category, **args):
+    """Record the enclosed block as a trace event, if TRACE_FILE is set."""
+    if not settings.TRACE_FILE:
+        yield
+        return
+    timestamp = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace_events.append(
+            {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': int(timestamp * 1e6),
+                'dur': int((time.perf_counter() - start) * 1e6),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+                'args': args,
+            }
+        )
+
+
+def trace_webdriver(driver):
+    """Record every command `driver` sends to the browser as a trace event."""
+    execute = driver.execute
+
+    def traced_execute(driver_command, params=None):
+        with traced(driver_command, 'webdriver'):
+            return execute(driver_command, params)
+
+    driver.execute = traced_execute
+
+
+@contextmanager
+def span(phase):
+    """Time the enclosed block as `phase` of the current page."""
+    global _depth
+    page = current_page
+    start = time.perf_counter()
+    _depth += 1
+    try:
+        with traced(phase, 'phase', page=page):
+            yield
+    finally:
+        _depth -= 1
+        test_spans.append(
+            {
+                'phase': phase,
+                'page': page,
+                'start': start,
+                'seconds': time.perf_counter() - start,
+                'depth': _depth,
+            }
+        )
+
+
+def finish_test(nodeid):
+    """Add up the spans of the test that just finished, write its JSON line to
+    SPANS_FILE, and start over for the next test.
+    """
+    global current_page
+    phases = defaultdict(float)
+    for recorded in test_spans:
+        if recorded['depth'] == 0:
+            phases[recorded['phase']] += recorded['seconds']
+            phase_seconds[(recorded['page'], recorded['phase'])].append(
+                recorded['seconds']
+            )
+
+    if settings.SPANS_FILE and test_spans:
+        test_start = min(recorded['start'] for recorded in test_spans)
+        line = {
+            'nodeid': nodeid,
+            'phases': phases,
+            'spans': [
+                dict(recorded, start=recorded['start'] - test_start)
+                for recorded in test_spans
+            ],
+        }
+        with open(settings.SPANS_FILE, 'a') as f:
+            f.write(json.dumps(line) + '\n')
+
+    del test_spans[:]
+    current_page = None
+
+
+def percentile(values, percent):
+    """Return the nearest-rank `percent` percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(int(round(percent / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summary(group_by_page):
+    """Return [(name, count, p50, p90, p99, max)] of the session's phase times, per
+    phase or, with `group_by_page`, per page class and phase.
+    """
+    grouped = defaultdict(list)
+    for (page, phase), seconds in phase_seconds.items():
+        name = '{} {}'.format(page or '-', phase) if group_by_page else phase
+        grouped[name].extend(seconds)
+    return [
+        (
+            name,
+            len(seconds),
+            percentile(seconds, 50),
+            percentile(seconds, 90),
+            percentile(seconds, 99),
+            max(seconds),
+        )
+        for name, seconds in sorted(grouped.items())
+    ]
+
+
+def write_trace(path):
+    """Write this process's trace events to `path`, on a track named after its
+    pytest-xdist worker.
+    """
+    process_name = {
+        'name': 'process_name',
+        'ph': 'M',
+        'pid': os.getpid(),
+        'args': {'name': os.environ.get('PYTEST_XDIST_WORKER', 'pytest')},
+    }
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': [process_name] + trace_events}, f)
+
+
+def merge_traces(path, worker_paths):
+    """Add the trace events of the files in `worker_paths` to this process's and write
+    them all to `path`. The worker files are removed.
+    """
+    for worker_path in worker_paths:
+        with open(worker_path) as f:
+            trace_events.extend(json.load(f)['traceEvents'])
+        os.remove(worker_path)
+    write_trace(path)
+
+
+def worker_trace_paths(path):
+    """Return the trace files pytest-xdist workers wrote for `path`."""
+    return glob.glob(path + '.gw*')
@@ -6,9 +6,15 @@ commands, run ``$ invoke --list``.
 """
 
 import glob
+import heapq
+import json
 import logging
 import os
+import statistics
+import subprocess
 import sys
+import time
+import urllib.parse
 
 from invoke import task
 
@@ -18,6 +24,19 @@ HERE = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
 BIN_PATH = os.path.dirname(sys.executable)
 bin_prefix = lambda cmd: os.path.join(BIN_PATH, cmd)
 MAX_RETRIES = int(os.getenv('MAX_RETRIES', 0))
+# Maximum number of test retries for a whole run. No limit if unset.
+RETRY_BUDGET = os.getenv('RETRY_BUDGET')
+# Seconds assumed for a test when no run has recorded a duration for any test yet
+DEFAULT_TEST_DURATION = float(os.getenv('DEFAULT_TEST_DURATION', 30))
+# Number of parallel browser workers, or 'auto' for one per CPU core. 0 runs serially.
+WORKERS = os.getenv('WORKERS', '0')
+# The test classes that scan their pages in tabs when TAB_SCANNING is on
+TAB_SCANNED_TESTS = [
+    'tests/test_a11y_collections.py::TestCollectionDiscoverPages',
+    'tests/test_a11y_institutions.py::TestBrandedInstitutionPages',
+    'tests/test_a11y_preprints.py::TestBrandedProviders',
+    'tests/test_a11y_registries.py::TestBrandedRegistrationsProviders',
+]
 
 
 @task(aliases=['flake8'])
@@ -48,6 +67,105 @@ def requirements(ctx, dev=False):
     ctx.run(cmd, echo=True)
 
 
+@task
+def browser_daemon(ctx, size=1, address='localhost:6000'):
+    """Keep `size` warm browsers running for test runs to attach to. Point test runs at
+    it by setting BROWSER_DAEMON to the same address. Stop it with Ctrl-C.
+
+    Examples:
+        invoke browser_daemon --size 2 --address localhost:6000
+    """
+    from browser_daemon import BrowserDaemon
+
+    logging.basicConfig(level=logging.INFO)
+    BrowserDaemon(size=size).serve_forever(address)
+
+
+@task
+def browser_daemon_status(ctx, address='localhost:6000'):
+    """Print how many of the browser daemon's browsers are leased and idle."""
+    from browser_daemon import status
+
+    print('>>> Browser daemon at {}: {}'.format(address, status(address)))
+
+
+@task
+def local_hub(ctx, size=2, browser='Chrome', address='localhost:4444'):
+    """Run a WebDriver hub in front of `size` local headless browsers. Point test
+    runs at it with DRIVER=Remote and REMOTE_HUB_URL=http://<address>/wd/hub. Stop it
+    with Ctrl-C, which prints the hub's queue and throughput stats.
+
+    Examples:
+        invoke local_hub --size 4 --browser Firefox --address localhost:4444
+    """
+    from browser_daemon import parse_address
+    from local_hub import LocalHub
+
+    logging.basicConfig(level=logging.INFO)
+    hub = LocalHub(parse_address(address), browser=browser, size=size)
+    try:
+        hub.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _print_hub_status(hub.status())
+
+
+@task
+def local_hub_status(ctx, hub_url='http://localhost:4444/wd/hub'):
+    """Print the session queue wait times and throughput of a running local hub."""
+    from local_hub import status
+
+    _print_hub_status(status(hub_url))
+
+
+def _print_hub_status(status):
+    print(
+        '>>> {sessions} {browser} sessions on {nodes} nodes ({busy} busy), '
+        '{sessions_per_minute:.1f} sessions/min, {commands_per_second:.1f} commands/s, '
+        'queue wait median {median_queue_wait:.1f}s max {max_queue_wait:.1f}s'.format(
+            **status
+        )
+    )
+
+
+@task
+def local_osf_api(
+    ctx, address='localhost:8000', latency=0.0, error_rate=0.0, error_status=503, seed=0
+):
+    """Run a local stand-in for the OSF api with in-memory data. Point test runs at it
+    with DOMAIN=local (and LOCAL_OSF_API_URL=http://<address> if it isn't the
+    default). `latency` delays every response by that many seconds, and a share
+    `error_rate` of the requests is answered with `error_status`. Stop it with Ctrl-C,
+    which prints how many requests it served.
+
+    Examples:
+        invoke local_osf_api --latency 0.05 --error-rate 0.1 --error-status 429
+    """
+    from browser_daemon import parse_address
+    from local_osf_api import LocalOSFApi
+
+    logging.basicConfig(level=logging.INFO)
+    api = LocalOSFApi(
+        parse_address(address),
+        latency=float(latency),
+        error_rate=float(error_rate),
+        error_status=int(error_status),
+        seed=int(seed),
+    )
+    try:
+        api.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(
+            '>>> {requests} requests ({errors} injected errors), '
+            '{requests_per_second:.1f} requests/s, {nodes} projects left'.format(
+                **api.stats()
+            )
+        )
+
+
 @task
 def test_module_wo_exit(ctx, module=None, params=None):
     """Helper for running tests."""
@@ -57,6 +175,9 @@ def test_module_wo_exit(ctx, module=None, params=None):
         params = []
 
     args = ['-s', '-v', '--tb=short', '--write_files', 'false', '--exclude_best_practice', 'true']
+    if WORKERS != '0':
+        # Keep each test class on one worker so its class-scoped login stays with it
+        args.extend(['-n', WORKERS, '--dist', 'loadscope'])
     for e in [module, params]:
         if e:
             args.extend([e] if isinstance(e, str) else e)
@@ -117,12 +238,371 @@ def test_cas_accessibility(ctx):
     test_with_retries(ctx, 'CAS', file_list)
 
 
+@task
+def benchmark_ember_transitions(ctx):
+    """Run the Ember page partition once with full page loads and once with in-app
+    Ember route transitions (EMBER_TRANSITIONS) and compare the wall-clock times.
+    """
+    args = _get_test_file_list() + ['-m', 'ember_page']
+    timings = {}
+    for mode in ['false', 'true']:
+        print('>>> Running Ember Pages with EMBER_TRANSITIONS={}'.format(mode))
+        timings[mode] = _timed_pytest_run(ctx, args, env={'EMBER_TRANSITIONS': mode})
+
+    _print_timings(
+        'Ember Pages',
+        [
+            ('full page loads', timings['false']),
+            ('Ember transitions', timings['true']),
+        ],
+    )
+
+
+@task
+def benchmark_page_load_strategy(ctx, partition='ember_page'):
+    """Run a partition of the suite (a pytest marker expression) once with each
+    PAGE_LOAD_STRATEGY and compare the wall-clock times.
+    """
+    args = _get_test_file_list() + ['-m', partition]
+    timings = []
+    for strategy in ['normal', 'eager']:
+        print('>>> Running {} with PAGE_LOAD_STRATEGY={}'.format(partition, strategy))
+        env = {'PAGE_LOAD_STRATEGY': strategy}
+        # Per-browser overrides would hide the strategy under test
+        for driver_name in ['CHROME', 'FIREFOX', 'EDGE', 'REMOTE']:
+            env['{}_PAGE_LOAD_STRATEGY'.format(driver_name)] = strategy
+        timings.append((strategy, _timed_pytest_run(ctx, args, env=env)))
+
+    _print_timings(partition, timings)
+
+
+@task
+def compare_headless(ctx, partition='ember_page'):
+    """Run a partition of the suite (a pytest marker expression) with the browser
+    defined by DRIVER once headed and once headless, and compare the wall-clock times
+    and the accessibility violations each run found.
+    """
+    import shutil
+
+    import settings
+
+    args = _get_test_file_list() + ['-m', partition]
+    timings = []
+    results_dirs = {}
+    for mode in ['headed', 'headless']:
+        results_dirs[mode] = os.path.join(settings.A11Y_RESULTS_DIR, mode)
+        shutil.rmtree(results_dirs[mode], ignore_errors=True)
+        print('>>> Running {} {} in {}'.format(partition, mode, settings.DRIVER))
+        env = {
+            'HEADLESS': str(mode == 'headless'),
+            'A11Y_RESULTS_DIR': results_dirs[mode],
+        }
+        timings.append((mode, _timed_pytest_run(ctx, args, env=env, write_files=True)))
+
+    _print_timings(partition, timings)
+    _compare_violations('headed', 'headless', results_dirs)
+
+
+@task
+def compare_tab_scanning(ctx):
+    """Run the tests that can scan their pages in tabs once with TAB_SCANNING off and
+    once with it on, and compare the wall-clock times and the accessibility violations
+    each run found.
+    """
+    import shutil
+
+    import settings
+
+    timings = []
+    results_dirs = {}
+    for mode in ['serial', 'tabs']:
+        results_dirs[mode] = os.path.join(settings.A11Y_RESULTS_DIR, mode)
+        shutil.rmtree(results_dirs[mode], ignore_errors=True)
+        print('>>> Running the tab scanned tests in {} mode'.format(mode))
+        env = {
+            'TAB_SCANNING': str(mode == 'tabs'),
+            'A11Y_RESULTS_DIR': results_dirs[mode],
+        }
+        timings.append(
+            (mode, _timed_pytest_run(ctx, TAB_SCANNED_TESTS, env=env, write_files=True))
+        )
+
+    _print_timings('tab scanned tests', timings)
+    _compare_violations('serial', 'tabs', results_dirs)
+
+
+@task
+def benchmark_browser_cache(ctx):
+    """Compare the first page load of the browser defined by DRIVER with a cold HTTP
+    cache and with the warm cache the first load left behind.
+    """
+    import shutil
+
+    import settings
+    from browser_cache import first_page_load_seconds, managed_cache_dir
+    from utils import launch_driver, quit_driver
+
+    shutil.rmtree(managed_cache_dir(settings.DRIVER), ignore_errors=True)
+    timings = []
+    for label in ['cold cache', 'warm cache']:
+        driver = launch_driver(use_daemon=False)
+        try:
+            timings.append((label, first_page_load_seconds(driver)))
+        finally:
+            quit_driver(driver)
+
+    print('>>> First page load of {} in {}:'.format(settings.OSF_HOME, settings.DRIVER))
+    for label, seconds in timings:
+        print('>>>   {:<12} {:6.2f}s'.format(label, seconds))
+
+
+@task
+def benchmark_api_session_setup(ctx, repeat=5):
+    """Time the api calls made while the test session is set up (checking the user's
+    credentials, waffle flags, institutions and provider lists), `repeat` times each with
+    a plain pythosf session and with the pooled session all api helpers now share. The
+    api cache is turned off while it runs, so that both sessions send every request.
+    """
+    from pythosf import client
+
+    import settings
+    from api import osf_api
+
+    def setup_calls(session):
+        osf_api.current_user(session)
+        osf_api.waffled_pages(session)
+        osf_api.get_all_institutions(session, data_type='ids')
+        for provider_type in ['preprints', 'collections', 'registrations']:
+            osf_api.get_providers_list(session, type=provider_type)
+
+    sessions = [
+        (
+            'pythosf session',
+            client.Session(
+                api_base_url=settings.API_DOMAIN,
+                auth=(settings.USER_ONE, settings.USER_ONE_PASSWORD),
+            ),
+        ),
+        ('pooled session', osf_api.get_default_session()),
+    ]
+    timings = []
+    api_cache = settings.API_CACHE
+    settings.API_CACHE = False
+    try:
+        for label, session in sessions:
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                setup_calls(session)
+                times.append(time.perf_counter() - start)
+            timings.append((label, times))
+    finally:
+        settings.API_CACHE = api_cache
+
+    print('>>> Session setup api calls, {} repetitions:'.format(repeat))
+    for label, times in timings:
+        print(
+            '>>>   {:<16} median {:6.2f}s  min {:6.2f}s  max {:6.2f}s'.format(
+                label, statistics.median(times), min(times), max(times)
+            )
+        )
+
+
+@task
+def compare_api_payloads(ctx):
+    """Print the size of the api responses the lookup helpers read, with the
+    filters and sparse fieldsets they send and without.
+    """
+    import settings
+    from api import osf_api
+
+    session = osf_api.get_default_session()
+    user = osf_api.current_user(session)
+    lookups = [
+        (
+            'get_most_recent_registration_node_id',
+            '/v2/registrations/',
+            osf_api.RECENT_REGISTRATION_QUERY,
+        ),
+        (
+            'get_most_recent_preprint_node_id',
+            '/v2/preprints/',
+            osf_api.RECENT_PREPRINT_QUERY,
+        ),
+        (
+            'get_user_institutions',
+            user.relationships.institutions['links']['related']['href'],
+            osf_api.INSTITUTION_NAME_QUERY,
+        ),
+    ]
+    print('>>> {:<40} {:>10} {:>10}'.format('helper', 'full', 'lean'))
+    for name, url, query_parameters in lookups:
+        sizes = []
+        for params in [{}, query_parameters]:
+            response = osf_api.get_transport().get(
+                urllib.parse.urljoin(settings.API_DOMAIN, url),
+                params=params,
+                auth=session.auth,
+                timeout=settings.API_TIMEOUT,
+            )
+            response.raise_for_status()
+            sizes.append(len(response.content))
+        print('>>> {:<40} {:>9}B {:>9}B'.format(name, *sizes))
+
+
+def _timed_pytest_run(ctx, args, env=None, write_files=False):
+    """Run pytest in a subprocess so that `env` is picked up by settings.py. Return
+    the wall-clock time and exit code of the run.
+    """
+    cmd = ' '.join(
+        [bin_prefix('pytest'), '-q', '--write_files', str(write_files).lower()]
+        + ["'{}'".format(arg) for arg in args]
+    )
+    start = time.perf_counter()
+    result = ctx.run(cmd, env=env or {}, warn=True, echo=True)
+    return time.perf_counter() - start, result.exited
+
+
+def _violation_counts(results_dir):
+    """Return {(results file, rule id): number of failing elements} for the axe
+    violations files in `results_dir`.
+    """
+    counts = {}
+    for path in glob.glob(os.path.join(results_dir, '*_violations_*.json')):
+        with open(path) as f:
+            for violation in json.load(f):
+                key = (os.path.basename(path), violation['id'])
+                counts[key] = len(violation['nodes'])
+    return counts
+
+
+def _compare_violations(baseline, mode, results_dirs):
+    """Print the violations that the `baseline` and `mode` runs found a different
+    number of failing elements for, and exit with status 1 if there are any.
+    """
+    expected = _violation_counts(results_dirs[baseline])
+    found = _violation_counts(results_dirs[mode])
+    differences = sorted(
+        key for key in set(expected) | set(found) if expected.get(key) != found.get(key)
+    )
+    if not differences:
+        print('>>> {} and {} runs found the same violations'.format(baseline, mode))
+        return
+    print(
+        '>>> Violations that differ (failing elements {} / {}):'.format(baseline, mode)
+    )
+    for results_file, rule in differences:
+        print(
+            '>>>   {} {}: {} / {}'.format(
+                results_file,
+                rule,
+                expected.get((results_file, rule), 0),
+                found.get((results_file, rule), 0),
+            )
+        )
+    sys.exit(1)
+
+
+def _print_timings(partition_name, timings):
+    """Print a comparison of (label, (seconds, exit code)) pairs against the first."""
+    baseline = timings[0][1][0]
+    print('>>> Timings for {}:'.format(partition_name))
+    for label, (elapsed, exited) in timings:
+        print(
+            '>>>   {:<24} {:8.1f}s  ({:+.1%} vs {}, exit code {})'.format(
+                label, elapsed, elapsed / baseline - 1, timings[0][0], exited
+            )
+        )
+
+
 def _get_test_file_list():
     all_test_files = glob.glob('tests/test_*.py')
     all_test_files.sort()
     return all_test_files
 
 
+@task
+def test_shard(ctx, index=0, total=1, marker=None):
+    """Run one of `total` shards of the test suite, numbered from 0. Test classes are
+    spread across the shards by longest-processing-time-first using the durations
+    recorded in TEST_DURATIONS_FILE by previous runs, so that every shard takes about
+    the same time.  Optionally limit the tests to a pytest `marker` expression.
+
+    Examples:
+        invoke test_shard --index 0 --total 4
+        invoke test_shard --index 2 --total 4 --marker ember_page
+    """
+    if not 0 <= index < total:
+        raise ValueError('Shard index must be between 0 and {}'.format(total - 1))
+
+    module = ['-m', marker] if marker else None
+    test_ids = _collect_test_ids(module)
+    shards = _assign_shards(test_ids, _load_test_durations(), total)
+    estimate, shard_ids = shards[index]
+
+    print(
+        '>>> Shard {} of {}: {} tests, estimated {:.0f}s'.format(
+            index, total, len(shard_ids), estimate
+        )
+    )
+    if not shard_ids:
+        sys.exit(0)
+    test_with_retries(
+        ctx, 'Shard {} of {}'.format(index, total), shard_ids, module=module
+    )
+
+
+def _collect_test_ids(module=None):
+    """Return the node ids of all tests pytest would run with the given arguments."""
+    args = [bin_prefix('pytest'), '--collect-only', '-q'] + _get_test_file_list()
+    output = subprocess.run(
+        args + (module or []), stdout=subprocess.PIPE, universal_newlines=True
+    ).stdout
+    return [line for line in output.splitlines() if '::' in line]
+
+
+def _load_test_durations():
+    # Same default as settings.TEST_DURATIONS_FILE
+    durations_file = os.getenv('TEST_DURATIONS_FILE', '.test_durations.json')
+    if not os.path.exists(durations_file):
+        return {}
+    with open(durations_file) as f:
+        return json.load(f)
+
+
+def _assign_shards(test_ids, durations, total):
+    """Split `test_ids` into `total` shards of roughly equal duration. Return a list of
+    (estimated seconds, test ids) per shard.
+
+    Tests of the same class are kept together so that class-scoped fixtures such as
+    logins are only set up in one shard. Tests with no recorded duration are assumed to
+    take the median of the recorded ones, or DEFAULT_TEST_DURATION without history.
+    """
+    known = [durations[test_id] for test_id in test_ids if test_id in durations]
+    fallback = statistics.median(known) if known else DEFAULT_TEST_DURATION
+
+    groups = {}
+    for test_id in test_ids:
+        # 'tests/test_a11y_x.py::TestClass::test_name[param]' -> 'tests/...::TestClass'
+        scope = test_id.rsplit('::', 1)[0]
+        groups.setdefault(scope, []).append(test_id)
+
+    shards = [[0.0, i, []] for i in range(total)]
+    heapq.heapify(shards)
+    by_cost = sorted(
+        groups.values(),
+        key=lambda ids: sum(durations.get(test_id, fallback) for test_id in ids),
+        reverse=True,
+    )
+    for ids in by_cost:
+        shard = heapq.heappop(shards)
+        shard[0] += sum(durations.get(test_id, fallback) for test_id in ids)
+        shard[2].extend(ids)
+        heapq.heappush(shards, shard)
+
+    return [(estimate, ids) for estimate, _, ids in sorted(shards, key=lambda s: s[1])]
+
+
 @task
 def test_with_retries(ctx, partition_name, file_list, module=None):
     """Run group of tests on the browser defined by TEST_BUILD."""
@@ -134,21 +614,11 @@ def test_with_retries(ctx, partition_name, file_list, module=None):
         )
     )
     print('>>> File list for {} is: {}'.format(partition_name, file_list))
-    retcode = test_module_wo_exit(ctx, params=file_list, module=module)
-
-    if retcode != 1:
-        sys.exit(retcode)
-
-    file_list = ['--last-failed', '--last-failed-no-failures', 'none'] + file_list
-
-    for i in range(1, MAX_RETRIES + 1):
-        print(
-            '>>> Retesting {} failures, iteration {}, in "/test/" '
-            'in {}'.format(partition_name, i, os.environ['TEST_BUILD'])
-        )
-        retcode = test_module_wo_exit(ctx, params=file_list, module=module)
-
-        if retcode != 1:
-            break
+    # Failed tests are retried within the same pytest session, reusing its browser
+    # and fixtures, instead of relaunching pytest with --last-failed
+    params = file_list + ['--retries', str(MAX_RETRIES)]
+    if RETRY_BUDGET:
+        params += ['--retry_budget', RETRY_BUDGET]
+    retcode = test_module_wo_exit(ctx, params=params, module=module)
 
     sys.exit(retcode)
@@ -1,19 +1,30 @@
+import json
+import os
+import time
+from collections import Counter
 from distutils.util import strtobool
 
 import pytest
+from _pytest.runner import runtestprotocol
 from faker import Faker
-from pythosf import client
 
+import pages.base
+import prefetcher
 import settings
-from api import osf_api
+import spans
+from api import cassettes, osf_api
+from api.data_pool import DataPool, pool_stats, seconds_saved
+from components.accessibility import scan_in_tabs, tab_scan_stats
+from pages.base import navigation_stats, visited_urls
 from pages.login import logout, safe_login
 from pages.project import ProjectPage
-from utils import launch_driver
+from request_blocker import blocking_stats
+from utils import launch_driver, quit_driver
 
 
 @pytest.fixture(scope='session')
 def session():
-    return client.Session(
+    return osf_api.OSFSession(
         api_base_url=settings.API_DOMAIN,
         auth=(settings.USER_ONE, settings.USER_ONE_PASSWORD),
     )
@@ -31,8 +42,9 @@ def check_credentials(session):
 @pytest.fixture(scope='session')
 def driver():
     driver = launch_driver()
+    spans.trace_webdriver(driver)
     yield driver
-    driver.quit()
+    quit_driver(driver)
 
 
 @pytest.fixture(scope='session')
@@ -70,18 +82,66 @@ def must_be_logged_in_as_user_two(driver):
     safe_login(driver, user=settings.USER_TWO, password=settings.USER_TWO_PASSWORD)
 
 
+@pytest.fixture(scope='class')
+def selected_tests(request):
+    """Return (test function name, parameters) for each test of the requesting class
+    that the run selected, so that class-scoped fixtures only prepare what those tests
+    use. Under pytest-xdist this includes the tests run by the other workers.
+    """
+    selected = []
+    for item in request.session.items:
+        if item.cls is request.cls:
+            callspec = getattr(item, 'callspec', None)
+            params = callspec.params if callspec else {}
+            selected.append((item.originalname or item.name, params))
+    return selected
+
+
+@pytest.fixture(scope='class')
+def tab_scans(request, driver, selected_tests, exclude_best_practice):
+    """Scan the pages of the requesting class's selected tests in tabs when TAB_SCANNING
+    is on, and return the scans for `check_tab_scan`. The class's
+    `tab_scan_page(driver, test_name, params)` returns a test's (page name, page, ready)
+    tuple for `scan_in_tabs`, or None if the test has no page to scan in a tab.
+    """
+    pages = []
+    for test_name, params in selected_tests:
+        page = request.cls.tab_scan_page(driver, test_name, params)
+        if page is not None:
+            pages.append(page)
+    return scan_in_tabs(driver, pages, exclude_best_practice=exclude_best_practice)
+
+
 @pytest.fixture(scope='class')
 def delete_user_projects_at_setup(session):
     osf_api.delete_all_user_projects(session=session)
 
 
+@pytest.fixture(scope='session')
+def data_pool(session):
+    """Provision the pool of projects the project fixtures lease from, if DATA_POOL
+    is on and PREFERRED_NODE isn't set.
+    """
+    if not settings.DATA_POOL or settings.PREFERRED_NODE:
+        yield None
+        return
+    pool = DataPool(session)
+    pool.provision()
+    yield pool
+    pool.teardown()
+
+
 @pytest.fixture
-def default_project(session):
+def default_project(session, data_pool):
     """Creates a new project through the api and returns it. Deletes the project at the end of the test run.
-    If PREFERRED_NODE is set, returns the APIDetail of preferred node.
+    If PREFERRED_NODE is set, returns the APIDetail of preferred node. If DATA_POOL is
+    on, leases a project from the pool instead.
     """
     if settings.PREFERRED_NODE:
         yield osf_api.get_node(session)
+    elif data_pool:
+        with data_pool.lease('private') as project:
+            yield project
     else:
         project = osf_api.create_project(session, title='OSF Test Project')
         yield project
@@ -94,24 +154,34 @@ def default_project_page(driver, default_project):
 
 
 @pytest.fixture
-def public_project(session):
+def public_project(session, data_pool):
     if settings.PRODUCTION:
         raise ValueError('You should not create public projects on production!')
+    if data_pool:
+        with data_pool.lease('public') as project:
+            yield project
+        return
     project = osf_api.create_project(session, title='OSF Test Project', public=True)
     yield project
     project.delete()
 
 
 @pytest.fixture
-def project_with_file(session, default_project):
+def project_with_file(request, session, data_pool):
     """Returns a project with a file.
-    Returns PREFERRED_NODE if it is set.
+    Returns PREFERRED_NODE if it is set, or a project with a file leased from the pool
+    if DATA_POOL is on.
     """
+    if data_pool:
+        with data_pool.lease('file') as project:
+            yield project
+        return
+    default_project = request.getfixturevalue('default_project')
     if settings.PREFERRED_NODE:
         osf_api.get_existing_file(session)
     else:
         osf_api.upload_fake_file(session, default_project)
-    return default_project
+    yield default_project
 
 
 def pytest_addoption(parser):
@@ -120,6 +190,17 @@ def pytest_addoption(parser):
     parser.addoption('--write_files', action='store')
     # Flag to determine whether to exclude Best Practice rules from accessibility check
     parser.addoption('--exclude_best_practice', action='store')
+    # Number of times to re-run a failed test within the same session
+    parser.addoption('--retries', action='store', type=int, default=0)
+    # Maximum number of re-runs for the whole session, no limit by default
+    parser.addoption('--retry_budget', action='store', type=int, default=None)
+    # Flag to fetch the api lookups cached in API_CACHE_DIR again
+    parser.addoption('--refresh_api_cache', action='store_true')
+
+
+def pytest_configure(config):
+    if config.getoption('refresh_api_cache'):
+        osf_api.cache_refreshed_at = time.time()
 
 
 @pytest.fixture()
@@ -140,7 +221,7 @@ def write_files(pytestconfig):
         return strtobool(pytestconfig.getoption('write_files'))
 
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def exclude_best_practice(pytestconfig):
     """Fixture to use command line input to exclude the Best Practice rule set from the
     accessibility checks.  Default (False) is to include the Best Practice rules. To use
@@ -156,3 +237,352 @@ def exclude_best_practice(pytestconfig):
         return False
     else:
         return strtobool(pytestconfig.getoption('exclude_best_practice'))
+
+
+# Time spent re-running failed tests in-process, and the estimated time the same
+# retries would have cost by relaunching pytest with --last-failed
+retry_stats = Counter()
+session_start = time.perf_counter()
+
+
+def pytest_collection_finish(session):
+    retry_stats['collection_seconds'] = time.perf_counter() - session_start
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_fixture_setup(fixturedef, request):
+    start = time.perf_counter()
+    with spans.traced(fixturedef.argname, 'fixture', scope=fixturedef.scope):
+        yield
+    if fixturedef.scope == 'session':
+        retry_stats['session_setup_seconds'] += time.perf_counter() - start
+
+
+def pytest_runtest_protocol(item, nextitem):
+    """Tell the prefetcher which page the next test starts on, then run the test.
+
+    Re-run a failed test up to `--retries` times, within `--retry_budget` re-runs for
+    the whole session. Re-runs reuse the driver, api session and every other fixture
+    that is still set up, rather than starting pytest over with `--last-failed`.
+    Only the reports of the final attempt count towards the test's outcome.
+    """
+    prefetcher.set_next(next_page_url(nextitem), partition(item))
+    del visited_urls[:]
+    cassettes.use(item.nodeid)
+
+    retries = item.config.getoption('retries')
+    if not retries:
+        return None
+
+    budget = item.config.getoption('retry_budget')
+    item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+    for attempt in range(retries + 1):
+        # Re-runs load every page afresh rather than reuse the failed attempt's
+        pages.base.force_navigation = attempt > 0
+        start = time.perf_counter()
+        reports = runtestprotocol(item, nextitem=nextitem, log=False)
+        if attempt:
+            retry_stats['retries'] += 1
+            retry_stats['retry_seconds'] += time.perf_counter() - start
+            retry_stats['passes'] = max(retry_stats['passes'], attempt)
+
+        last_attempt = attempt == retries or (
+            budget is not None and retry_stats['retries'] >= budget
+        )
+        if last_attempt or not any(report.failed for report in reports):
+            break
+        for report in reports:
+            if report.failed:
+                report.outcome = 'rerun'
+            item.ihook.pytest_runtest_logreport(report=report)
+        clear_failed_setup(item)
+    pages.base.force_navigation = False
+
+    for report in reports:
+        item.ihook.pytest_runtest_logreport(report=report)
+    item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+    return True
+
+
+def clear_failed_setup(item):
+    """Forget the fixtures that failed to set up for `item`, and the failed setup of
+    its class and module, so that a re-run sets them up again rather than re-raising
+    the cached error. This is what pytest-rerunfailures does.
+    """
+    for fixturedefs in item._fixtureinfo.name2fixturedefs.values():
+        for fixturedef in fixturedefs:
+            cached_result = getattr(fixturedef, 'cached_result', None)
+            if cached_result is not None and cached_result[2]:
+                fixturedef.cached_result = None
+                # later versions expect no finalizers left when setting a fixture up
+                if hasattr(fixturedef, '_finalizers'):
+                    del fixturedef._finalizers[:]
+    setup_state = item.session._setupstate
+    if isinstance(setup_state.stack, dict):
+        # pytest >= 6.3 keeps (finalizers, exception) for every node being set up
+        for node, (finalizers, exc) in list(setup_state.stack.items()):
+            if exc:
+                setup_state.stack[node] = (finalizers, None)
+    else:
+        # earlier versions remember a failed setup in the node's _prepare_exc
+        for node in setup_state.stack:
+            if hasattr(node, '_prepare_exc'):
+                del node._prepare_exc
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    with spans.traced(item.nodeid, 'test'):
+        yield
+
+
+def pytest_report_teststatus(report):
+    if report.outcome == 'rerun':
+        return 'rerun', 'R', ('RERUN', {'yellow': True})
+
+
+def partition(item):
+    """Return the name of the part of the suite `item` belongs to."""
+    for marker in ['ember_page', 'legacy_page']:
+        if marker in item.keywords:
+            return marker
+    return 'other'
+
+
+# Urls each test visited in the previous run, as recorded in PAGE_MANIFEST_FILE, and
+# the urls each test visited in this run, keyed by node id
+page_manifest = {}
+page_visits = {}
+
+
+def pytest_sessionstart(session):
+    if os.path.exists(settings.PAGE_MANIFEST_FILE):
+        with open(settings.PAGE_MANIFEST_FILE) as f:
+            page_manifest.update(json.load(f))
+
+
+def next_page_url(nextitem):
+    """Return the first url the next test is expected to visit, or None if it isn't
+    known or changes from run to run.
+    """
+    entry = page_manifest.get(nextitem.nodeid) if nextitem else None
+    if entry and entry['stable'] and entry['urls']:
+        return entry['urls'][0]
+    return None
+
+
+def pytest_runtest_logfinish(nodeid):
+    spans.finish_test(nodeid)
+    cassettes.use(None)
+    # Under pytest-xdist the controller never visits any pages itself
+    if visited_urls:
+        # Retries visit the same urls again
+        page_visits[nodeid] = list(dict.fromkeys(visited_urls))
+
+
+def save_page_manifest(visits):
+    """Record this run's urls in PAGE_MANIFEST_FILE, marking the tests that visited
+    the same urls as in the previous run as stable.
+    """
+    manifest = dict(page_manifest)
+    for nodeid, urls in visits.items():
+        previous = page_manifest.get(nodeid, {}).get('urls')
+        manifest[nodeid] = {'urls': urls, 'stable': urls == previous}
+    with open(settings.PAGE_MANIFEST_FILE, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+
+def worker_output(obj):
+    """Return the dict a pytest-xdist worker sends back to the controller when it
+    finishes. `obj` is either the worker's config or the controller's node for that
+    worker. Returns None when not running under pytest-xdist.
+    """
+    # pytest-xdist < 2.0 calls its workers slaves
+    for name in ['workeroutput', 'slaveoutput']:
+        if hasattr(obj, name):
+            return getattr(obj, name)
+    return None
+
+
+# Seconds spent in setup, call and teardown of each test in this run, keyed by node id
+test_durations = Counter()
+
+
+def pytest_runtest_logreport(report):
+    # Under pytest-xdist the controller receives every worker's reports as well. Failed
+    # attempts of re-run tests are left out, so they don't skew the shard balancing.
+    if report.outcome != 'rerun':
+        test_durations[report.nodeid] += report.duration
+
+
+def pytest_sessionfinish(session):
+    cassettes.save(cassettes.current)
+    output = worker_output(session.config)
+    if output is None and settings.API_RECORD_MODE == 'record':
+        cassettes.merge_worker_cassettes()
+    if not session.config.pluginmanager.hasplugin('dsession'):
+        # Every pass of the old relaunch approach collected and set up the session
+        # again. The pytest-xdist controller adds up its workers' estimates instead.
+        retry_stats['relaunch_seconds'] = retry_stats['passes'] * (
+            retry_stats['collection_seconds'] + retry_stats['session_setup_seconds']
+        ) + retry_stats['retry_seconds']
+    if output is not None:
+        output['navigation_stats'] = dict(navigation_stats)
+        output['retry_stats'] = dict(retry_stats)
+        output['api_cache_stats'] = dict(osf_api.cache_stats)
+        output['pool_stats'] = dict(pool_stats)
+        output['tab_scan_stats'] = dict(tab_scan_stats)
+        output['page_visits'] = page_visits
+        output['phase_seconds'] = [
+            [page, phase, seconds]
+            for (page, phase), seconds in spans.phase_seconds.items()
+        ]
+        output['prefetch_stats'] = {
+            name: dict(counts) for name, counts in prefetcher.prefetch_stats.items()
+        }
+        output['blocking_stats'] = {
+            page: dict(counts) for page, counts in blocking_stats.items()
+        }
+    else:
+        if test_durations:
+            save_test_durations(test_durations)
+        if page_visits:
+            save_page_manifest(page_visits)
+    if settings.TRACE_FILE:
+        if output is not None:
+            # The controller merges every worker's trace into TRACE_FILE
+            spans.write_trace(
+                '{}.{}'.format(settings.TRACE_FILE, os.environ['PYTEST_XDIST_WORKER'])
+            )
+        else:
+            spans.merge_traces(
+                settings.TRACE_FILE, spans.worker_trace_paths(settings.TRACE_FILE)
+            )
+
+
+def save_test_durations(durations):
+    """Merge this run's test durations into the history in TEST_DURATIONS_FILE."""
+    history = {}
+    if os.path.exists(settings.TEST_DURATIONS_FILE):
+        with open(settings.TEST_DURATIONS_FILE) as f:
+            history = json.load(f)
+    history.update(durations)
+    with open(settings.TEST_DURATIONS_FILE, 'w') as f:
+        json.dump(history, f, indent=2, sort_keys=True)
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """Merge the results a parallel worker collected into the controller's totals."""
+    output = worker_output(node)
+    if output:
+        navigation_stats.update(output.get('navigation_stats', {}))
+        retry_stats.update(output.get('retry_stats', {}))
+        osf_api.cache_stats.update(output.get('api_cache_stats', {}))
+        pool_stats.update(output.get('pool_stats', {}))
+        tab_scan_stats.update(output.get('tab_scan_stats', {}))
+        page_visits.update(output.get('page_visits', {}))
+        for page, phase, seconds in output.get('phase_seconds', []):
+            spans.phase_seconds[(page, phase)].extend(seconds)
+        for name, counts in output.get('prefetch_stats', {}).items():
+            prefetcher.prefetch_stats[name].update(counts)
+        for page, counts in output.get('blocking_stats', {}).items():
+            blocking_stats[page].update(counts)
+
+
+def pytest_terminal_summary(terminalreporter):
+    """Report how `BasePage.goto` reached its pages, where the time on them went,
+    what was blocked from loading on them, how much scanning pages in tabs and
+    prefetching the next page overlapped, how often the api cache was used, how much
+    project setup the data pool saved, and what retries cost in the run.
+    """
+    terminalreporter.write_sep('-', 'navigation summary')
+    terminalreporter.write_line(
+        'goto page loads: {}, Ember transitions: {}, navigations avoided: {}'.format(
+            navigation_stats['loaded'],
+            navigation_stats['transitioned'],
+            navigation_stats['avoided'],
+        )
+    )
+    if spans.phase_seconds:
+        for group_by_page in [False, True]:
+            terminalreporter.write_sep(
+                '-', 'time per page and phase' if group_by_page else 'time per phase'
+            )
+            terminalreporter.write_line(
+                '{:<60} {:>6} {:>8} {:>8} {:>8} {:>8}'.format(
+                    'phase', 'count', 'p50', 'p90', 'p99', 'max'
+                )
+            )
+            for row in spans.summary(group_by_page):
+                terminalreporter.write_line(
+                    '{:<60} {:>6} {:>7.2f}s {:>7.2f}s {:>7.2f}s {:>7.2f}s'.format(*row)
+                )
+    if blocking_stats:
+        terminalreporter.write_sep('-', 'request blocking summary')
+        for page, counts in sorted(blocking_stats.items()):
+            terminalreporter.write_line(
+                '{}: {} third-party requests blocked, saving about {:.1f} MB and {} '
+                'requests of unknown size'.format(
+                    page,
+                    counts['blocked'],
+                    counts['saved_bytes'] / 1e6,
+                    counts['unsized'],
+                )
+            )
+    if tab_scan_stats['pages']:
+        terminalreporter.write_sep('-', 'tab scanning summary')
+        terminalreporter.write_line(
+            '{} pages scanned in tabs in {:.1f}s, their page loads and scans took '
+            '{:.1f}s in total'.format(
+                tab_scan_stats['pages'],
+                tab_scan_stats['seconds'],
+                tab_scan_stats['page_seconds'],
+            )
+        )
+    if prefetcher.prefetch_stats:
+        terminalreporter.write_sep('-', 'prefetch summary')
+        for name, counts in sorted(prefetcher.prefetch_stats.items()):
+            terminalreporter.write_line(
+                '{}: {} next pages prefetched, {} finished during the scan, {:.1f}s of '
+                'network time overlapped'.format(
+                    name,
+                    counts['prefetched'],
+                    counts['finished'],
+                    counts['overlap_seconds'],
+                )
+            )
+    if osf_api.cache_stats:
+        terminalreporter.write_sep('-', 'api cache summary')
+        terminalreporter.write_line(
+            '{} api lookups answered from the cache, {} fetched'.format(
+                osf_api.cache_stats['hits'], osf_api.cache_stats['misses']
+            )
+        )
+    if pool_stats['leases']:
+        terminalreporter.write_sep('-', 'data pool summary')
+        terminalreporter.write_line(
+            '{} projects leased, {} created in {:.1f}s of provisioning, resets took '
+            '{:.1f}s'.format(
+                pool_stats['leases'],
+                pool_stats['created'],
+                pool_stats['provision_seconds'],
+                pool_stats['reset_seconds'],
+            )
+        )
+        saved = seconds_saved(pool_stats)
+        if saved is not None:
+            terminalreporter.write_line(
+                'creating a project for every lease would have taken about {:.1f}s '
+                'more'.format(saved)
+            )
+    if retry_stats['retries']:
+        terminalreporter.write_sep('-', 'retry summary')
+        terminalreporter.write_line(
+            '{} in-process retries took {:.1f}s, relaunching pytest for them would '
+            'have taken about {:.1f}s'.format(
+                retry_stats['retries'],
+                retry_stats['retry_seconds'],
+                retry_stats['relaunch_seconds'],
+            )
+        )
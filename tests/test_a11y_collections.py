@@ -6,6 +6,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 import markers
 from api import osf_api
 from components.accessibility import ApplyA11yRules as a11y
+from components.accessibility import check_tab_scan, here_then_gone
 from pages.collections import (
     CollectionDiscoverPage,
     CollectionModerationAcceptedPage,
@@ -36,14 +37,24 @@ class TestCollectionDiscoverPages:
     def provider(self, request):
         return request.param
 
+    def tab_scan_page(driver, test_name, params):
+        """Return the Discover page of a selected test for the `tab_scans` fixture."""
+        return (
+            'cp_' + params['provider']['id'],
+            CollectionDiscoverPage(driver, provider=params['provider']),
+            here_then_gone('loading_indicator'),
+        )
+
     def test_accessibility(
-        self, session, driver, provider, write_files, exclude_best_practice
+        self, session, driver, provider, tab_scans, write_files, exclude_best_practice
     ):
+        page_name = 'cp_' + provider['id']
+        if check_tab_scan(tab_scans, page_name, write_files=write_files):
+            return
         discover_page = CollectionDiscoverPage(driver, provider=provider)
         discover_page.goto()
         assert CollectionDiscoverPage(driver, verify=True)
         discover_page.loading_indicator.here_then_gone()
-        page_name = 'cp_' + provider['id']
         a11y.run_axe(
             driver,
             session,
@@ -81,7 +92,12 @@ class TestCollectionSubmitPage:
         assert CollectionSubmitPage(driver, verify=True)
         submit_page.project_selector.click()
         submit_page.project_help_text.here_then_gone()
-        submit_page.project_selector_project.click()
+        # Pick the project by title, since the user may have other projects from the
+        # data pool. The project of PREFERRED_NODE isn't loaded, so it has no title.
+        submit_page.select_power_select_option(
+            submit_page.project_selector_input,
+            getattr(project_with_file, 'title', None),
+        )
         submit_page.loading_indicator.here_then_gone()
         a11y.run_axe(
             driver,
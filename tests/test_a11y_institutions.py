@@ -6,6 +6,7 @@ from selenium.webdriver.support.ui import WebDriverWait
 import markers
 from api import osf_api
 from components.accessibility import ApplyA11yRules as a11y
+from components.accessibility import check_tab_scan, showing
 from pages.institutions import (
     InstitutionAdminDashboardPage,
     InstitutionBrandedPage,
@@ -42,9 +43,31 @@ class TestBrandedInstitutionPages:
     def institution(self, request):
         return request.param
 
+    def tab_scan_page(driver, test_name, params):
+        """Return the branded institution page of a selected test for the `tab_scans`
+        fixture.
+        """
+        return (
+            'bi_' + params['institution'],
+            InstitutionBrandedPage(driver, institution_id=params['institution']),
+            lambda page: showing(page, 'empty_collection_indicator')
+            or page.driver.find_elements(
+                By.CSS_SELECTOR, '#tb-tbody > div > div > div.tb-row'
+            ),
+        )
+
     def test_accessibility(
-        self, driver, session, institution, write_files, exclude_best_practice
+        self,
+        driver,
+        session,
+        institution,
+        tab_scans,
+        write_files,
+        exclude_best_practice,
     ):
+        page_name = 'bi_' + institution
+        if check_tab_scan(tab_scans, page_name, write_files=write_files):
+            return
         institution_page = InstitutionBrandedPage(driver, institution_id=institution)
         institution_page.goto()
         assert InstitutionBrandedPage(driver, verify=True)
@@ -56,7 +79,6 @@ class TestBrandedInstitutionPages:
                     (By.CSS_SELECTOR, '#tb-tbody > div > div > div.tb-row')
                 )
             )
-        page_name = 'bi_' + institution
         a11y.run_axe(
             driver,
             session,
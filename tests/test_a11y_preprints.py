@@ -7,6 +7,7 @@ import markers
 import settings
 from api import osf_api
 from components.accessibility import ApplyA11yRules as a11y
+from components.accessibility import check_tab_scan
 from pages.preprints import (
     PreprintDetailPage,
     PreprintDiscoverPage,
@@ -82,7 +83,12 @@ class TestPreprintSubmitPage:
         submit_page.upload_from_existing_project_button.click()
         submit_page.upload_project_selector.click()
         submit_page.upload_project_help_text.here_then_gone()
-        submit_page.upload_project_selector_project.click()
+        # Pick the project by title, since the user may have other projects from the
+        # data pool. The project of PREFERRED_NODE isn't loaded, so it has no title.
+        submit_page.select_power_select_option(
+            submit_page.upload_project_selector_input,
+            getattr(project_with_file, 'title', None),
+        )
         submit_page.upload_select_file.click()
         submit_page.upload_file_save_continue.click()
         submit_page.public_available_button.click()
@@ -147,9 +153,34 @@ class TestBrandedProviders:
     def provider(self, request):
         return request.param
 
+    def tab_scan_page(driver, test_name, params):
+        """Return the Landing or Discover page of a selected test for the `tab_scans`
+        fixture. Engineering Archive is left out for the reason given in the tests
+        below.
+        """
+        provider = params['provider']
+        if 'engrxiv' in provider['id']:
+            return None
+        if test_name == 'test_accessibility_landing':
+            return (
+                'bp_' + provider['id'],
+                PreprintLandingPage(driver, provider=provider),
+                None,
+            )
+        if test_name == 'test_accessibility_discover':
+            return (
+                'bp_' + provider['id'] + '_disc',
+                PreprintDiscoverPage(driver, provider=provider),
+                None,
+            )
+        return None
+
     def test_accessibility_landing(
-        self, session, driver, provider, write_files, exclude_best_practice
+        self, session, driver, provider, tab_scans, write_files, exclude_best_practice
     ):
+        page_name = 'bp_' + provider['id']
+        if check_tab_scan(tab_scans, page_name, write_files=write_files):
+            return
         # As of January 24, 2022, the Engineering Archive ('engrxiv') preprint provider
         # has switched away from using OSF as their preprint service.  Therefore the
         # web page that OSF automatically redirects to is no longer based on the OSF
@@ -163,7 +194,6 @@ class TestBrandedProviders:
             landing_page = PreprintLandingPage(driver, provider=provider)
             landing_page.goto()
             assert PreprintLandingPage(driver, verify=True)
-            page_name = 'bp_' + provider['id']
             a11y.run_axe(
                 driver,
                 session,
@@ -173,8 +203,11 @@ class TestBrandedProviders:
             )
 
     def test_accessibility_discover(
-        self, session, driver, provider, write_files, exclude_best_practice
+        self, session, driver, provider, tab_scans, write_files, exclude_best_practice
     ):
+        page_name = 'bp_' + provider['id'] + '_disc'
+        if check_tab_scan(tab_scans, page_name, write_files=write_files):
+            return
         # As of January 24, 2022, the Engineering Archive ('engrxiv') preprint provider
         # has switched away from using OSF as their preprint service.  Therefore the
         # web page that OSF automatically redirects to is no longer based on the OSF
@@ -188,7 +221,6 @@ class TestBrandedProviders:
             discover_page = PreprintDiscoverPage(driver, provider=provider)
             discover_page.goto()
             assert PreprintDiscoverPage(driver, verify=True)
-            page_name = 'bp_' + provider['id'] + '_disc'
             a11y.run_axe(
                 driver,
                 session,
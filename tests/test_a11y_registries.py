@@ -7,6 +7,7 @@ import markers
 import settings
 from api import osf_api
 from components.accessibility import ApplyA11yRules as a11y
+from components.accessibility import check_tab_scan, here_then_gone
 from pages.login import safe_login
 from pages.registrations import MyRegistrationsPage
 from pages.registries import (
@@ -1224,9 +1225,22 @@ class TestBrandedRegistrationsProviders:
     def provider(self, request):
         return request.param
 
+    def tab_scan_page(driver, test_name, params):
+        """Return the Discover page of a selected test for the `tab_scans` fixture."""
+        if params['provider']['id'] == 'osf':
+            return None
+        return (
+            'br_' + params['provider']['id'],
+            BrandedRegistriesDiscoverPage(driver, provider=params['provider']),
+            here_then_gone('loading_indicator'),
+        )
+
     def test_accessibility(
-        self, session, driver, provider, write_files, exclude_best_practice
+        self, session, driver, provider, tab_scans, write_files, exclude_best_practice
     ):
+        page_name = 'br_' + provider['id']
+        if check_tab_scan(tab_scans, page_name, write_files=write_files):
+            return
         # Test for all providers except OSF since the OSF Registries Discover page no
         # longer exists
         if provider['id'] != 'osf':
@@ -1234,7 +1248,6 @@ class TestBrandedRegistrationsProviders:
             discover_page.goto()
             assert BrandedRegistriesDiscoverPage(driver, verify=True)
             discover_page.loading_indicator.here_then_gone()
-            page_name = 'br_' + provider['id']
             a11y.run_axe(
                 driver,
                 session,
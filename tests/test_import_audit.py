@@ -0,0 +1,79 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import every module of the given packages with all network access disabled, and
+# print the modules that tried to open a connection
+AUDIT_SCRIPT = """
+import importlib
+import pkgutil
+import socket
+import sys
+import traceback
+
+
+class NetworkBlocked(Exception):
+    pass
+
+
+def blocked(*args, **kwargs):
+    raise NetworkBlocked('Network access at import: {}'.format(args))
+
+
+socket.socket.connect = blocked
+socket.socket.connect_ex = blocked
+socket.create_connection = blocked
+socket.getaddrinfo = blocked
+
+failed = []
+for package in sys.argv[1:]:
+    for module in pkgutil.iter_modules([package]):
+        name = '{}.{}'.format(package, module.name)
+        try:
+            importlib.import_module(name)
+        except Exception:
+            if 'NetworkBlocked' in traceback.format_exc():
+                failed.append(name)
+print('\\n'.join(failed))
+"""
+
+
+# The session fixtures that the conftest runs for every test need the network and a
+# browser, which is what this test checks that imports don't use
+@pytest.fixture
+def check_credentials():
+    pass
+
+
+@pytest.fixture
+def waffled_pages():
+    pass
+
+
+@pytest.fixture
+def hide_cookie_banner():
+    pass
+
+
+@pytest.fixture
+def default_logout():
+    pass
+
+
+def test_imports_make_no_network_calls():
+    """Importing pages, components and the api helpers must not talk to OSF, so that
+    test collection works and stays fast without the network.
+    """
+    result = subprocess.run(
+        [sys.executable, '-c', AUDIT_SCRIPT, 'pages', 'components', 'api'],
+        cwd=ROOT,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == []
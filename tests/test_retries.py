@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A class whose class-scoped fixture fails the first time it is set up, with the
+# session fixtures of the conftest replaced by ones that need neither the network nor
+# a browser
+FLAKY_CLASS_FIXTURE_TESTS = """
+import pytest
+
+setups = []
+
+
+@pytest.fixture(scope='session')
+def driver():
+    pass
+
+
+@pytest.fixture(scope='session')
+def check_credentials():
+    pass
+
+
+@pytest.fixture(scope='session')
+def waffled_pages():
+    pass
+
+
+@pytest.fixture(scope='session')
+def hide_cookie_banner():
+    pass
+
+
+@pytest.fixture(scope='class')
+def default_logout():
+    pass
+
+
+class TestFlakyClassFixture:
+    @pytest.fixture(scope='class')
+    def flaky_login(self):
+        setups.append(1)
+        if len(setups) == 1:
+            raise RuntimeError('Login failed')
+
+    def test_first(self, flaky_login):
+        pass
+
+    def test_second(self, flaky_login):
+        pass
+"""
+
+
+# The session fixtures that the conftest runs for every test need the network and a
+# browser, which the re-run tests don't use
+@pytest.fixture
+def check_credentials():
+    pass
+
+
+@pytest.fixture
+def waffled_pages():
+    pass
+
+
+@pytest.fixture
+def hide_cookie_banner():
+    pass
+
+
+@pytest.fixture
+def default_logout():
+    pass
+
+
+def test_retry_sets_up_failed_class_fixture_again(tmpdir):
+    """A re-run of a test whose class-scoped fixture failed must set the fixture up
+    again rather than re-raise the error cached by the failed attempt.
+    """
+    shutil.copy(os.path.join(ROOT, 'tests', 'conftest.py'), str(tmpdir))
+    tmpdir.join('test_flaky.py').write(FLAKY_CLASS_FIXTURE_TESTS)
+    result = subprocess.run(
+        [
+            sys.executable,
+            '-m',
+            'pytest',
+            '-p',
+            'no:cacheprovider',
+            '--retries',
+            '1',
+            str(tmpdir),
+        ],
+        cwd=ROOT,
+        # Keep the records of the run out of those of the real suite
+        env=dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            TEST_DURATIONS_FILE=str(tmpdir.join('test_durations.json')),
+            PAGE_MANIFEST_FILE=str(tmpdir.join('page_manifest.json')),
+        ),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+    )
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert '2 passed' in result.stdout
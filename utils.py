@@ -1,26 +1,75 @@
 from selenium import webdriver
 
+import browser_cache
+import request_blocker
 import settings
+from browser_daemon import DaemonDriver
 
+# Command line switches that keep headless Chrome and Edge from spending time on work
+# a test run doesn't need, and render every page at the same size and scale
+HEADLESS_CHROMIUM_ARGS = [
+    '--headless',
+    '--disable-gpu',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--force-device-scale-factor=1',
+    '--window-size={},{}'.format(*settings.WINDOW_SIZE),
+]
 
-def launch_driver(driver_name=settings.DRIVER, desired_capabilities=None):
+# The equivalent preferences for headless Firefox
+HEADLESS_FIREFOX_PREFERENCES = {
+    'browser.shell.checkDefaultBrowser': False,
+    'browser.startup.homepage_override.mstone': 'ignore',
+    'datareporting.policy.dataSubmissionEnabled': False,
+    'toolkit.telemetry.reporter.enabled': False,
+    'app.update.auto': False,
+    'extensions.update.enabled': False,
+    'layers.acceleration.disabled': True,
+    'layout.css.devPixelsPerPx': '1.0',
+}
+
+
+def launch_driver(
+    driver_name=settings.DRIVER, desired_capabilities=None, use_daemon=True
+):
     """Create and configure a WebDriver.
     Args:
         driver_name : Name of WebDriver to use
         desired_capabilities : Desired browser specs
+        use_daemon : Lease a warm browser from BROWSER_DAEMON, if it is set, instead
+            of launching a new one
     """
+    if use_daemon and settings.BROWSER_DAEMON and driver_name != 'Remote':
+        return DaemonDriver(settings.BROWSER_DAEMON)
 
     try:
         driver_cls = getattr(webdriver, driver_name)
     except AttributeError:
         driver_cls = getattr(webdriver, settings.DRIVER)
 
+    proxy = None
+    if settings.REQUEST_BLOCKING and driver_name != 'Remote':
+        proxy = request_blocker.start()
+
+    cache_dir = None
+    if settings.BROWSER_CACHE and driver_name in ['Chrome', 'Firefox', 'Edge']:
+        cache_dir = browser_cache.prepare_cache_dir(driver_name)
+
+    page_load_strategy = settings.PAGE_LOAD_STRATEGIES.get(
+        driver_name, settings.PAGE_LOAD_STRATEGY
+    )
+
     if driver_name == 'Remote':
         if desired_capabilities is None:
             desired_capabilities = settings.DESIRED_CAP
-        command_executor = 'http://{}:{}@hub.browserstack.com:80/wd/hub'.format(
-            settings.BSTACK_USER, settings.BSTACK_KEY
+        desired_capabilities = dict(
+            desired_capabilities, pageLoadStrategy=page_load_strategy
         )
+        command_executor = settings.REMOTE_HUB_URL
 
         from selenium.webdriver.firefox.options import Options
 
@@ -47,21 +96,30 @@ def launch_driver(driver_name=settings.DRIVER, desired_capabilities=None):
         from selenium.webdriver.chrome.options import Options
 
         chrome_options = Options()
-        chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('window-size=1200x600')
+        for argument in HEADLESS_CHROMIUM_ARGS:
+            chrome_options.add_argument(argument)
+        chrome_options.set_capability('pageLoadStrategy', page_load_strategy)
+        if proxy:
+            chrome_options.add_argument('--proxy-server={}'.format(proxy))
+        if cache_dir:
+            chrome_options.add_argument('--disk-cache-dir={}'.format(cache_dir))
         driver = driver_cls(options=chrome_options)
     elif driver_name == 'Chrome' and not settings.HEADLESS:
         from selenium.webdriver.chrome.options import Options
 
         chrome_options = Options()
         chrome_options.set_capability('unhandledPromptBehavior', 'accept')
+        chrome_options.set_capability('pageLoadStrategy', page_load_strategy)
         # disable w3c for local testing
         chrome_options.add_experimental_option('w3c', False)
         preferences = {'download.default_directory': ''}
         chrome_options.add_experimental_option('prefs', preferences)
+        if proxy:
+            chrome_options.add_argument('--proxy-server={}'.format(proxy))
+        if cache_dir:
+            chrome_options.add_argument('--disk-cache-dir={}'.format(cache_dir))
         driver = driver_cls(options=chrome_options)
-    elif driver_name == 'Firefox' and not settings.HEADLESS:
+    elif driver_name == 'Firefox':
         from selenium.webdriver.firefox.options import Options
 
         ffo = Options()
@@ -76,22 +134,66 @@ def launch_driver(driver_name=settings.DRIVER, desired_capabilities=None):
         )
         # Force Firefox to open links in new tab instead of new browser window.
         ffo.set_preference('browser.link.open_newwindow', 3)
+        ffo.set_capability('pageLoadStrategy', page_load_strategy)
+        if settings.HEADLESS:
+            ffo.headless = True
+            ffo.add_argument('--width={}'.format(settings.WINDOW_SIZE[0]))
+            ffo.add_argument('--height={}'.format(settings.WINDOW_SIZE[1]))
+            for name, value in HEADLESS_FIREFOX_PREFERENCES.items():
+                ffo.set_preference(name, value)
+        if proxy:
+            host, port = proxy.split(':')
+            # Manual proxy configuration
+            ffo.set_preference('network.proxy.type', 1)
+            ffo.set_preference('network.proxy.http', host)
+            ffo.set_preference('network.proxy.http_port', int(port))
+            ffo.set_preference('network.proxy.ssl', host)
+            ffo.set_preference('network.proxy.ssl_port', int(port))
+        if cache_dir:
+            ffo.set_preference('browser.cache.disk.parent_directory', cache_dir)
+            # Keep the cache from being trimmed to a size too small for the bundles
+            ffo.set_preference('browser.cache.disk.smart_size.enabled', False)
+            ffo.set_preference('browser.cache.disk.capacity', 1024000)
         driver = driver_cls(options=ffo)
-    elif driver_name == 'Edge' and not settings.HEADLESS:
+    elif driver_name == 'Edge':
         from msedge.selenium_tools import Edge
 
         # Need to set the flag so that we use the newer Chromium based version of Edge
         # instead of older IE based version of Edge
-        desired_capabilities = {'ms:edgeChromium': True}
+        desired_capabilities = {
+            'ms:edgeChromium': True,
+            'pageLoadStrategy': page_load_strategy,
+        }
+        edge_args = list(HEADLESS_CHROMIUM_ARGS) if settings.HEADLESS else []
+        if proxy:
+            edge_args.append('--proxy-server={}'.format(proxy))
+        if cache_dir:
+            edge_args.append('--disk-cache-dir={}'.format(cache_dir))
+        if edge_args:
+            desired_capabilities['ms:edgeOptions'] = {'args': edge_args}
         driver = Edge(desired_capabilities=desired_capabilities)
 
     else:
         driver = driver_cls()
 
-    driver.maximize_window()
+    if settings.HEADLESS and driver_name != 'Remote':
+        # A headless browser has no screen to maximize to, so give it the size of one
+        driver.set_window_size(*settings.WINDOW_SIZE)
+    else:
+        driver.maximize_window()
+    if cache_dir:
+        driver.http_cache = (driver_name, cache_dir)
     return driver
 
 
+def quit_driver(driver):
+    """Quit the driver and save its browser's HTTP cache for the next run."""
+    driver.quit()
+    http_cache = getattr(driver, 'http_cache', None)
+    if http_cache:
+        browser_cache.save_cache_dir(*http_cache)
+
+
 def find_current_browser(driver):
     current_browser = driver.desired_capabilities.get('browserName')
     return current_browser